@@ -1,9 +1,84 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from game_logic.game import Game
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, conint
+from game_logic.archive import ArchiveWriter
+from game_logic.batch_request import BatchRequest, check_limits
+from game_logic.belief import belief_state
+from game_logic.deck import daily_seed
+from game_logic.event_store import EventStore
+from game_logic.expiry import IDLE_TTL, MAX_AGE, MAX_GAMES, ExpiringStore
+from game_logic.game import AVOID_ROOM, Game
+from game_logic.hash_ring import HashRing
+from game_logic.hint import DEFAULT_BUDGET_MS, rank_actions
+from game_logic.leaderboard import Leaderboard
+from game_logic.odds import state_win_probability
+from game_logic.seed_index import DIFFICULTIES, SeedIndex
+from game_logic.sqlite_store import SQLiteStore
+from game_logic.stats import GameStats
+from game_logic.verify import DEFAULT_CHUNK, describe, encode_claims, verify_chunk
 
-app = FastAPI()
+MAX_HINT_BUDGET_MS = 5000
+MAX_VERIFY_CLAIMS = 100000
+# Built offline with python -m game_logic.seed_index
+SEED_INDEX_PATH = os.environ.get(
+    "SCOUNDREL_SEED_INDEX", os.path.join(os.path.dirname(__file__), "seed_index.bin"))
+LEADERBOARD_PATH = os.environ.get(
+    "SCOUNDREL_LEADERBOARD", os.path.join(os.path.dirname(__file__), "leaderboard.log"))
+MAX_LEADERBOARD_LIMIT = 100
+# Finished games are appended here (see game_logic.archive)
+ARCHIVE_PATH = os.environ.get(
+    "SCOUNDREL_ARCHIVE", os.path.join(os.path.dirname(__file__), "games.archive"))
+# Keep games in this SQLite database instead of only in memory
+DATABASE_PATH = os.environ.get("SCOUNDREL_DATABASE")
+# Games unused for IDLE_TTL seconds, older than MAX_AGE seconds, or beyond the
+# MAX_GAMES most recently used are dropped, or moved to the SPILL database and
+# brought back when played again (see game_logic.expiry)
+IDLE_TTL_SECONDS = float(os.environ.get("SCOUNDREL_IDLE_TTL", IDLE_TTL))
+MAX_AGE_SECONDS = float(os.environ.get("SCOUNDREL_MAX_AGE", MAX_AGE))
+MAX_LIVE_GAMES = int(os.environ.get("SCOUNDREL_MAX_GAMES", MAX_GAMES))
+SPILL_PATH = os.environ.get("SCOUNDREL_SPILL")
+SPILL_CACHE_SIZE = 1000
+# With several server processes, each publishes its stats here for the others
+STATS_DIR = os.environ.get("SCOUNDREL_STATS_DIR")
+STATS_PUBLISH_SECONDS = 10
+# WebSocket sessions (see game_socket)
+WS_HEARTBEAT_SECONDS = 20
+WS_MAX_PENDING = 32
+# "index/count" when this process is one shard of several behind router.py;
+# it then only creates games whose ids hash onto it
+SHARD = os.environ.get("SCOUNDREL_SHARD")
+
+# Hint searches and score verification are CPU bound, so they run in
+# worker processes
+worker_pool = None
+# Held while a game is played or read outside the event loop (see /batch)
+play_lock = threading.RLock()
+# Opened on the first difficulty request
+seed_index = None
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    if worker_pool is not None:
+        worker_pool.shutdown(cancel_futures=True)
+    leaderboard.close()
+    archive.close()
+    games.close()
+    if STATS_DIR:
+        publish_stats()
+
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -14,34 +89,446 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store active games
-games = {}
+shard_index, shard_ring = None, None
+if SHARD:
+    shard_index, shard_count = map(int, SHARD.split("/"))
+    shard_ring = HashRing(shard_count)
+
+# Store active games as seeds and action logs (see game_logic.store)
+games = ExpiringStore(
+    SQLiteStore(DATABASE_PATH) if DATABASE_PATH else EventStore(),
+    spill=SQLiteStore(SPILL_PATH, cache_size=SPILL_CACHE_SIZE) if SPILL_PATH else None,
+    idle_ttl=IDLE_TTL_SECONDS, max_age=MAX_AGE_SECONDS, max_games=MAX_LIVE_GAMES,
+    owns=None if shard_ring is None else lambda game_id: shard_ring.owner(game_id) == shard_index)
+# Final scores of finished games
+leaderboard = Leaderboard(LEADERBOARD_PATH)
+archive = ArchiveWriter(ARCHIVE_PATH)
+# Aggregate play statistics, see GET /stats
+stats = GameStats()
+stats_published = 0
 
 class GameAction(BaseModel):
     game_id: str
     action_type: str
     card_index: int = None
+    with_win_probability: bool = False
+    # The version of the client's state; the reply is then a patch on it
+    # (see Game.get_patch) when the server still has the changes since
+    since_version: int = None
+
+class HintRequest(BaseModel):
+    game_id: str
+    budget_ms: int = DEFAULT_BUDGET_MS
+
+class ScoreClaim(BaseModel):
+    seed: int
+    # Bounded so that encode_claims can store them in its arrays
+    actions: list[conint(ge=0, le=AVOID_ROOM)]
+    score: conint(ge=-(1 << 63), lt=1 << 63)
 
 @app.post("/new-game")
-async def create_game():
-    game = Game()
-    game_id = game.id
-    games[game_id] = game
-    return {"game_id": game_id, "state": game.get_state()}
+async def create_game(difficulty: str = None, challenge: str = None):
+    game = new_game(difficulty, challenge)
+    return {"game_id": game.id, "state": game.get_state()}
+
+def new_game(difficulty=None, challenge=None):
+    """Start and store a game, as asked for by POST /new-game"""
+    global seed_index
+    seed = None
+    if challenge is not None:
+        if challenge != "daily":
+            raise HTTPException(status_code=400, detail="challenge must be daily")
+        if difficulty is not None:
+            raise HTTPException(status_code=400, detail="A challenge has a fixed difficulty")
+        day = datetime.now(timezone.utc).date()
+        seed = daily_seed(day)
+        challenge = f"daily-{day.isoformat()}"
+    elif difficulty is not None:
+        if difficulty not in DIFFICULTIES:
+            raise HTTPException(status_code=400, detail=f"difficulty must be one of {', '.join(DIFFICULTIES)}")
+        if seed_index is None:
+            if not os.path.exists(SEED_INDEX_PATH):
+                raise HTTPException(status_code=503, detail="No seed index available")
+            seed_index = SeedIndex(SEED_INDEX_PATH)
+        seed = seed_index.pick(difficulty)
+        if seed is None:
+            raise HTTPException(status_code=503, detail=f"No {difficulty} seeds in the index")
+    
+    game = Game(seed, challenge)
+    if shard_ring is not None:
+        game.id = shard_ring.new_key(shard_index)
+    games.add(game)
+    return game
+
+def play(game, action_type, card_index=None):
+    """Play an action on a stored game, then save it and update the stats,
+    and the leaderboard and archive if the game ended. Takes play_lock, as
+    /batch plays in a worker thread."""
+    with play_lock:
+        started = time.perf_counter()
+        was_over = game.is_over()
+        room = list(game.current_room)
+        room_number = game.room_number
+        slain = game.player.slain_monsters
+        slain_count = len(slain)
+        
+        if action_type == "select_card":
+            game.select_card(card_index)
+            card = room[card_index]
+            stats.record_action(card, len(slain) > slain_count, (), not game.player.is_alive(),
+                                time.perf_counter() - started)
+        elif action_type == "avoid_room":
+            game.avoid_room()
+            stats.record_action(None, False, room, False, time.perf_counter() - started)
+        games.record(game)
+        
+        if not was_over and game.is_over():
+            leaderboard.record(game)
+            archive.append(game)
+            stats.record_game(game, 0 if game.player.is_alive() else room_number)
+            if STATS_DIR and time.monotonic() - stats_published >= STATS_PUBLISH_SECONDS:
+                publish_stats()
+
+def play_action(game, action):
+    """Play an action (as in Game.apply) on the latest stored version of a
+    game and save it. Returns the game played on, reloaded if another request
+    played on it since. Raises KeyError if the game is gone and ValueError if
+    the action is illegal."""
+    with play_lock:
+        if games.version(game.id) != game.version:
+            game = games.load(game.id)
+        if type(action) is not int or action not in game.legal_actions():
+            raise ValueError(f"Illegal action {action!r}")
+        if action == AVOID_ROOM:
+            play(game, "avoid_room")
+        else:
+            play(game, "select_card", action)
+        return game
 
 @app.post("/action")
 async def perform_action(action: GameAction):
-    if action.game_id not in games:
+    try:
+        with play_lock:
+            # Loaded under the lock, so that /batch does not play on it meanwhile
+            game = games.load(action.game_id)
+            play(game, action.action_type, action.card_index)
+    except KeyError:
+        # Unknown, or expired since
         raise HTTPException(status_code=404, detail="Game not found")
+    if action.with_win_probability:
+        await work_out_win_probability(game)
     
-    game = games[action.game_id]
+    if action.since_version is not None:
+        patch = game.get_patch(action.since_version, action.with_win_probability)
+        if patch is not None:
+            return {"patch": patch}
+    return {"state": game.get_state(action.with_win_probability)}
+
+# Many creates and plays in one request, for bots, load tests and replays.
+# Operations run in order in a single pass, and one that fails is reported
+# in its result without stopping the rest: a play stops at its first illegal
+# action, keeping the actions before it. Results are {"games": [{"game_id",
+# "state"}]} for a create and {"game_id", "played", "state"} for a play,
+# each with "error" null or its reason. With final_only the answer is just
+# {"states": {game_id: state}} for every game created or played, and
+# {"errors": [{"index", "error"}]}.
+@app.post("/batch")
+async def run_batch(batch: BatchRequest):
+    try:
+        check_limits(batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    if action.action_type == "select_card":
-        game.select_card(action.card_index)
-    elif action.action_type == "avoid_room":
-        game.avoid_room()
+    # A large batch takes seconds, so it runs in a thread, answer and all
+    return await run_in_threadpool(run_operations, batch)
+
+def run_operations(batch):
+    """Run the operations of a /batch request and render its answer"""
+    operations = batch.operations
+    # Each game is loaded once
+    loaded = {}
+    results = []
+    for operation in operations:
+        if operation.op == "create":
+            result = {"games": [], "error": None}
+            try:
+                for _ in range(operation.count):
+                    game = new_game(operation.difficulty, operation.challenge)
+                    loaded[game.id] = game
+                    result["games"].append(
+                        {"game_id": game.id, "state": None if batch.final_only else game.get_state()})
+            except HTTPException as e:
+                result["error"] = e.detail
+        elif operation.op == "play":
+            game_id = operation.game_id
+            result = {"game_id": game_id, "played": 0, "state": None, "error": None}
+            try:
+                game = loaded.get(game_id)
+                if game is None:
+                    if game_id is None:
+                        raise KeyError(game_id)
+                    game = loaded[game_id] = games.load(game_id)
+                for action in operation.actions:
+                    # Other requests may play the same game meanwhile, so each
+                    # action is played on the stored game and saved
+                    try:
+                        game = loaded[game_id] = play_action(game, action)
+                    except ValueError:
+                        result["error"] = f"Illegal action {action} after {result['played']}"
+                        break
+                    result["played"] += 1
+                if not batch.final_only:
+                    with play_lock:
+                        result["state"] = game.get_state()
+            except KeyError:
+                # Unknown, or reached its maximum age during the batch
+                loaded.pop(game_id, None)
+                result["error"] = "Game not found"
+        else:
+            result = {"error": f"Unknown op {operation.op!r}"}
+        results.append(result)
     
-    return {"state": game.get_state()}
+    if batch.final_only:
+        states = {}
+        for game_id, game in loaded.items():
+            with play_lock:
+                states[game_id] = game.get_state()
+        return JSONResponse({"states": states,
+                             "errors": [{"index": index, "error": result["error"]}
+                                        for index, result in enumerate(results)
+                                        if result["error"] is not None]})
+    return JSONResponse({"results": results})
+
+# A session over one connection. The client sends {"type": "action",
+# "action": n}, n as in Game.apply (0-3 pick that room card, 4 avoids the
+# room), and gets {"type": "patch"} on the last state it was sent, or
+# {"type": "state"} when that is too far back. Connecting with since_version
+# resumes from the state the client already has. After WS_HEARTBEAT_SECONDS
+# of silence the server sends {"type": "ping"}, and it closes the connection
+# (code 4408) when the client stays silent for twice that. At most
+# WS_MAX_PENDING frames are queued; the rest wait unread in the socket, and
+# queued actions are answered with a single patch.
+@app.websocket("/ws/{game_id}")
+async def game_socket(websocket: WebSocket, game_id: str, since_version: int = None,
+                      with_win_probability: bool = False):
+    await websocket.accept()
+    try:
+        game = games.load(game_id)
+    except KeyError:
+        await websocket.close(code=4404, reason="Game not found")
+        return
+    
+    sent = await push_game(websocket, game, since_version, with_win_probability)
+    pending = asyncio.Queue(WS_MAX_PENDING)
+    heard = [time.monotonic()]
+    reader = asyncio.create_task(read_frames(websocket, pending, heard))
+    try:
+        while True:
+            try:
+                frames = [await asyncio.wait_for(pending.get(), WS_HEARTBEAT_SECONDS)]
+            except asyncio.TimeoutError:
+                if time.monotonic() - heard[0] > 2 * WS_HEARTBEAT_SECONDS:
+                    await websocket.close(code=4408, reason="No heartbeat")
+                    return
+                await websocket.send_json({"type": "ping"})
+                continue
+            while not pending.empty():
+                frames.append(pending.get_nowait())
+            
+            replies = []
+            for frame in frames:
+                if frame is None:
+                    # The client is gone; the actions it sent are still played
+                    continue
+                try:
+                    message = json.loads(frame)
+                    kind = message.get("type")
+                except (ValueError, AttributeError):
+                    replies.append({"type": "error", "detail": "Frames must be JSON objects"})
+                    continue
+                if kind == "ping":
+                    replies.append({"type": "pong"})
+                elif kind == "action":
+                    try:
+                        game = play_action(game, message.get("action"))
+                    except KeyError:
+                        await websocket.close(code=4404, reason="Game not found")
+                        return
+                    except ValueError as e:
+                        replies.append({"type": "error", "detail": str(e)})
+                elif kind != "pong":
+                    replies.append({"type": "error", "detail": f"Unknown frame type {kind!r}"})
+            if frames[-1] is None:
+                return
+            if game.version != sent:
+                sent = await push_game(websocket, game, sent, with_win_probability)
+            for reply in replies:
+                await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+
+async def read_frames(websocket, pending, heard):
+    """Queue the client's frames, then None when it disconnects"""
+    cancelled = False
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            heard[0] = time.monotonic()
+            await pending.put(message.get("text") or message.get("bytes") or "")
+    except asyncio.CancelledError:
+        # The session is over and reads no more, so the queue may stay full
+        cancelled = True
+        raise
+    finally:
+        if not cancelled:
+            await pending.put(None)
+
+async def push_game(websocket, game, since_version, with_win_probability):
+    """Send a patch on since_version, or the full state if there is none.
+    Returns the version sent."""
+    if with_win_probability:
+        await work_out_win_probability(game)
+    patch = None
+    if since_version is not None:
+        patch = game.get_patch(since_version, with_win_probability)
+    if patch is None:
+        await websocket.send_json({"type": "state", "state": game.get_state(with_win_probability)})
+    else:
+        await websocket.send_json({"type": "patch", "patch": patch})
+    return game.version
+
+@app.get("/state/{game_id}")
+async def get_game_state(game_id: str, request: Request, with_win_probability: bool = False):
+    # The ETag is the version, so an unchanged game is answered without
+    # rebuilding or serializing it
+    suffix = "-p" if with_win_probability else ""
+    try:
+        version = games.version(game_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Game not found")
+    etag = f'"{version}{suffix}"'
+    matches = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in matches or f"W/{etag}" in matches or "*" in matches:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    
+    try:
+        game = games.load(game_id)
+    except KeyError:
+        # Expired since
+        raise HTTPException(status_code=404, detail="Game not found")
+    if with_win_probability:
+        await work_out_win_probability(game)
+    return JSONResponse({"game_id": game_id, "state": game.get_state(with_win_probability)},
+                        headers={"ETag": f'"{game.version}{suffix}"', "Cache-Control": "no-cache"})
+
+@app.post("/hint")
+async def get_hint(request: HintRequest):
+    if request.budget_ms <= 0:
+        raise HTTPException(status_code=400, detail="budget_ms must be positive")
+    try:
+        game = games.load(request.game_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Game not found")
+    if game.is_over():
+        return {"hints": [], "depth": 0}
+    
+    loop = asyncio.get_running_loop()
+    ranking, depth = await loop.run_in_executor(
+        get_worker_pool(), rank_actions, belief_state(game), game.player.max_health,
+        min(request.budget_ms, MAX_HINT_BUDGET_MS))
+    
+    hints = []
+    for action, expected_score in ranking:
+        if action == AVOID_ROOM:
+            hint = {"action_type": "avoid_room"}
+        else:
+            hint = {"action_type": "select_card", "card_index": action}
+        hint["expected_score"] = round(expected_score, 2)
+        hints.append(hint)
+    return {"hints": hints, "depth": depth}
+
+async def work_out_win_probability(game):
+    """Work out game.win_probability() in a worker process, so that
+    get_state and get_patch only read it back"""
+    loop = asyncio.get_running_loop()
+    version = game.version
+    probability = await loop.run_in_executor(
+        get_worker_pool(), state_win_probability, belief_state(game), game.player.max_health)
+    # Another request may have played on in the meantime
+    if game.version == version:
+        game.set_win_probability(probability)
+
+def publish_stats():
+    global stats_published
+    path = os.path.join(STATS_DIR, f"stats-{os.getpid()}.json")
+    with open(path + ".tmp", "w") as stats_file:
+        json.dump(stats.state(), stats_file)
+    os.replace(path + ".tmp", path)
+    stats_published = time.monotonic()
+
+@app.get("/stats")
+async def get_stats():
+    merged = GameStats()
+    merged.merge(stats)
+    if STATS_DIR:
+        own = os.path.join(STATS_DIR, f"stats-{os.getpid()}.json")
+        for path in glob.glob(os.path.join(STATS_DIR, "stats-*.json")):
+            if path != own:
+                with open(path) as stats_file:
+                    merged.merge(GameStats.from_state(json.load(stats_file)))
+    return merged.summary()
+
+def get_worker_pool():
+    global worker_pool
+    if worker_pool is None:
+        worker_pool = ProcessPoolExecutor()
+    return worker_pool
+
+@app.post("/verify")
+async def verify_scores(claims: list[ScoreClaim]):
+    if len(claims) > MAX_VERIFY_CLAIMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_VERIFY_CLAIMS} claims per request")
+    for claim in claims:
+        if not 0 <= claim.seed < 1 << 64:
+            raise HTTPException(status_code=400, detail="seed must fit in 64 bits")
+    
+    async def verdicts():
+        # Every chunk is queued at once; verdicts stream out in claim order
+        loop = asyncio.get_running_loop()
+        pool = get_worker_pool()
+        running = []
+        for start in range(0, len(claims), DEFAULT_CHUNK):
+            arrays = encode_claims([claim.model_dump() for claim in claims[start:start + DEFAULT_CHUNK]])
+            running.append((arrays, loop.run_in_executor(pool, verify_chunk, *arrays)))
+        for (seeds, _, _, claimed), future in running:
+            for row in zip(seeds, *await future, claimed):
+                yield json.dumps(describe(*row)) + "\n"
+    
+    return StreamingResponse(verdicts(), media_type="application/x-ndjson")
+
+@app.get("/leaderboard")
+async def get_leaderboard(board: str = "global", limit: int = 10):
+    if not 1 <= limit <= MAX_LEADERBOARD_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_LEADERBOARD_LIMIT}")
+    entries = [{"rank": rank, "game_id": game_id, "score": score}
+               for rank, (score, game_id) in enumerate(leaderboard.top(board, limit), 1)]
+    return {"board": board, "entries": entries}
+
+@app.get("/leaderboard/rank/{game_id}")
+async def get_leaderboard_rank(game_id: str, board: str = "global"):
+    entry = leaderboard.rank(game_id, board)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Game not on this leaderboard")
+    rank, score = entry
+    return {"board": board, "game_id": game_id, "rank": rank, "score": score}
+
+@app.get("/leaderboard/count")
+async def get_leaderboard_count(above: int, board: str = "global"):
+    return {"board": board, "above": above, "count": leaderboard.above(above, board)}
 
 if __name__ == "__main__":
     import uvicorn
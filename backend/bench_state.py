@@ -0,0 +1,41 @@
+"""Compare packed game states against copy.deepcopy.
+
+Run from the backend directory: python bench_state.py
+"""
+import copy
+import pickle
+import timeit
+
+from game_logic.game import Game
+
+
+def mid_game():
+    """A game a few rooms in, so every pile has something in it. The seed
+    is fixed so runs can be compared."""
+    game = Game(14)
+    for _ in range(12):
+        game.select_card(0)
+    return game
+
+
+def main():
+    game = mid_game()
+    data = game.to_bytes()
+    number = 20000
+
+    runs = [
+        ("copy.deepcopy(game)", lambda: copy.deepcopy(game)),
+        ("game.to_bytes()", game.to_bytes),
+        ("Game.from_bytes(data)", lambda: Game.from_bytes(data, game.id)),
+        ("round trip", lambda: Game.from_bytes(game.to_bytes(), game.id)),
+    ]
+    for name, func in runs:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        print(f"{name:<24} {seconds / number * 1e6:8.2f} us")
+
+    print(f"{'pickled game':<24} {len(pickle.dumps(game)):8d} bytes")
+    print(f"{'packed game':<24} {len(data):8d} bytes")
+
+
+if __name__ == "__main__":
+    main()
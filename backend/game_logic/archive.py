@@ -0,0 +1,140 @@
+"""Append-only archive of finished games, read through memory maps.
+
+    python -m game_logic.archive games.archive
+
+An archive is two files:
+
+* PATH.games: HEADER_DTYPE records, one per game, with the seed, final
+  score (Game.calculate_score), number of actions, creation and finishing
+  times in milliseconds, and where the game's actions start.
+* PATH.actions: the actions of every game, two per byte with the first in
+  the low four bits, each game starting on a fresh byte. An action is a
+  room index for select_card or AVOID_ROOM for avoid_room.
+
+Archive maps both files, so its columns are NumPy arrays over the file and
+a question such as the mean score of games that avoided the first room:
+
+    archive = Archive(path)
+    avoided = archive.action_column(0) == AVOID_ROOM
+    archive.score[avoided].mean()
+
+creates no Python object per game. Actions are written before the header
+that points at them, so a crash at worst leaves unreferenced actions or a
+torn header, which ArchiveWriter cuts off when it reopens the archive.
+"""
+import argparse
+import os
+import time
+import numpy as np
+from .game import AVOID_ROOM
+
+HEADER_DTYPE = np.dtype([("seed", "<u8"), ("score", "<i2"), ("length", "u1"),
+                         ("created", "<i8"), ("finished", "<i8"), ("offset", "<u8")])
+NO_ACTION = -1
+
+
+def pack_actions(actions):
+    """Actions (each below 16) packed two per byte, first in the low bits"""
+    actions = np.frombuffer(bytes(actions), dtype=np.uint8)
+    if len(actions) % 2:
+        actions = np.append(actions, np.uint8(0))
+    return (actions[0::2] | (actions[1::2] << 4)).tobytes()
+
+
+class ArchiveWriter:
+    def __init__(self, path):
+        self.path = path
+        self.games = open(path + ".games", "ab")
+        # Drop a header torn by a crash
+        size = self.games.tell()
+        if size % HEADER_DTYPE.itemsize:
+            self.games.truncate(size - size % HEADER_DTYPE.itemsize)
+        self.actions = open(path + ".actions", "ab")
+        self.offset = self.actions.tell()
+
+    def append(self, game, finished=None):
+        """Add a finished game played from a seed"""
+        if game.seed is None:
+            raise ValueError("Only seeded games can be archived")
+        finished = finished if finished is not None else time.time()
+        packed = pack_actions(game.actions)
+        header = np.array([(game.seed, game.calculate_score(), len(game.actions),
+                            round(game.created * 1000), round(finished * 1000), self.offset)],
+                          dtype=HEADER_DTYPE)
+        self.actions.write(packed)
+        self.actions.flush()
+        self.offset += len(packed)
+        self.games.write(header.tobytes())
+        self.games.flush()
+
+    def close(self):
+        self.games.close()
+        self.actions.close()
+
+
+class Archive:
+    """Read-only view of an archive. Columns are memory-mapped arrays."""
+
+    def __init__(self, path):
+        size = os.path.getsize(path + ".games") // HEADER_DTYPE.itemsize
+        if size:
+            self.headers = np.memmap(path + ".games", dtype=HEADER_DTYPE, mode="r", shape=(size,))
+        else:
+            self.headers = np.zeros(0, dtype=HEADER_DTYPE)
+        if os.path.getsize(path + ".actions"):
+            self.packed = np.memmap(path + ".actions", dtype=np.uint8, mode="r")
+        else:
+            self.packed = np.zeros(0, dtype=np.uint8)
+        self.seed = self.headers["seed"]
+        self.score = self.headers["score"]
+        self.length = self.headers["length"]
+        self.created = self.headers["created"]
+        self.finished = self.headers["finished"]
+        self.offset = self.headers["offset"]
+
+    def __len__(self):
+        return len(self.headers)
+
+    def actions(self, index):
+        """The actions of one game as a list"""
+        start = int(self.offset[index])
+        length = int(self.length[index])
+        packed = self.packed[start:start + (length + 1) // 2]
+        actions = np.empty(2 * len(packed), dtype=np.uint8)
+        actions[0::2] = packed & 15
+        actions[1::2] = packed >> 4
+        return actions[:length].tolist()
+
+    def action_column(self, k, start=0, stop=None):
+        """The k-th action of games start..stop-1, NO_ACTION for games
+        with fewer actions. Slice big archives to bound the memory used."""
+        length = self.length[start:stop]
+        played = length > k
+        byte = self.offset[start:stop][played] + k // 2
+        column = np.full(len(length), NO_ACTION, dtype=np.int8)
+        column[played] = (self.packed[byte] >> (4 * (k % 2))) & 15
+        return column
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m game_logic.archive",
+                                     description="Summarize an archive of finished games.")
+    parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    archive = Archive(args.path)
+    if not len(archive):
+        print("No games")
+        return
+    won = archive.score > 0
+    avoided = archive.action_column(0) == AVOID_ROOM
+    print(f"{len(archive)} games, {won.mean():.2%} won, mean score {archive.score.mean():.2f}")
+    print(f"mean length {archive.length.mean():.1f} actions, "
+          f"median duration {np.median(archive.finished - archive.created) / 1000:.1f}s")
+    if avoided.any():
+        print(f"avoided the first room: {avoided.mean():.2%} of games, "
+              f"mean score {archive.score[avoided].mean():.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""Many games played in lockstep on NumPy arrays.
+
+BatchGame holds N games as arrays (one row per game) and applies the rules
+to all of them at once, so a policy that also works on whole arrays can
+play millions of games without a Python call per move. Games are dealt
+with deck.deal_order, and a batch game plays exactly like Game(seed) given
+the same actions.
+"""
+import numpy as np
+from .card import CARDS
+from .game import AVOID_ROOM
+from .zobrist import MAX_DECK_POSITIONS
+
+MONSTER = 0
+WEAPON = 1
+POTION = 2
+
+# Card tables indexed by card id
+KIND = np.array([{"monster": MONSTER, "weapon": WEAPON, "potion": POTION}[card.type]
+                 for card in CARDS], dtype=np.int8)
+VALUE = np.array([card.true_value for card in CARDS], dtype=np.int8)
+
+EMPTY = -1
+ROOM_SIZE = 4
+# Every game ends within this many actions: 44 picks and an avoid at most
+# every fourth action
+MAX_ACTIONS = 64
+
+
+def deal_orders(seeds):
+    """deck.deal_order for every seed, as an (N, 44) array of card ids"""
+    seeds = np.asarray(seeds).astype(np.uint64)
+    n = len(seeds)
+    ids = np.tile(np.arange(len(CARDS), dtype=np.int8), (n, 1))
+    rows = np.arange(n)
+    state = seeds.copy()
+    for i in range(len(CARDS) - 1, 0, -1):
+        state += np.uint64(0x9E3779B97F4A7C15)
+        z = (state ^ (state >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+        j = ((z >> np.uint64(32)) * np.uint64(i + 1)) >> np.uint64(32)
+        j = j.astype(np.intp)
+        card = ids[:, i].copy()
+        ids[:, i] = ids[rows, j]
+        ids[rows, j] = card
+    return ids
+
+
+class BatchGame:
+    def __init__(self, seeds, max_health=20):
+        seeds = np.asarray(seeds)
+        n = self.size = len(seeds)
+        self.max_health = max_health
+        self.rows = np.arange(n)
+
+        # Deck order by position: dealt cards first, avoided rooms after
+        self.deck = np.full((n, MAX_DECK_POSITIONS), EMPTY, dtype=np.int8)
+        self.head = np.zeros(n, dtype=np.int16)
+        self.deck_end = np.zeros(n, dtype=np.int16)
+
+        self.health = np.zeros(n, dtype=np.int16)
+        self.weapon = np.zeros(n, dtype=np.int8)  # weapon value, 0 for none
+        self.last_slain = np.zeros(n, dtype=np.int8)  # 0 until the weapon slays
+        self.bonus = np.zeros(n, dtype=np.int8)  # potion on top of the discard pile
+        self.room = np.full((n, ROOM_SIZE), EMPTY, dtype=np.int8)
+        self.room_count = np.zeros(n, dtype=np.int8)
+        self.chosen = np.zeros(n, dtype=np.int8)
+        self.used_potion = np.zeros(n, dtype=bool)
+        self.avoided = np.zeros(n, dtype=bool)
+        self.over = np.zeros(n, dtype=bool)
+        self.room_number = np.zeros(n, dtype=np.int16)  # rooms entered so far
+        self.death_room = np.zeros(n, dtype=np.int16)  # room of death, 0 if alive
+
+        # Every action taken, for replaying a game with Game.apply
+        self.actions = np.full((n, MAX_ACTIONS), EMPTY, dtype=np.int8)
+        self.action_count = np.zeros(n, dtype=np.int16)
+
+        self.seeds = np.zeros(n, dtype=seeds.dtype)
+        self.reset(self.rows, seeds)
+
+    def reset(self, rows, seeds):
+        """Start new games in the given rows, dealt from seeds"""
+        self.seeds[rows] = seeds
+        self.deck[rows] = EMPTY
+        self.deck[rows, :len(CARDS)] = deal_orders(seeds)
+        self.head[rows] = 0
+        self.deck_end[rows] = len(CARDS)
+        self.health[rows] = self.max_health
+        self.weapon[rows] = 0
+        self.last_slain[rows] = 0
+        self.bonus[rows] = 0
+        self.room[rows] = EMPTY
+        self.room_count[rows] = 0
+        self.chosen[rows] = 0
+        self.used_potion[rows] = False
+        self.avoided[rows] = False
+        self.over[rows] = False
+        self.room_number[rows] = 1
+        self.death_room[rows] = 0
+        self.actions[rows] = EMPTY
+        self.action_count[rows] = 0
+        mask = np.zeros(self.size, dtype=bool)
+        mask[rows] = True
+        self._fill_room(mask)
+
+    def _fill_room(self, mask):
+        """Draw cards into the rooms of the masked games until they hold 4"""
+        for _ in range(ROOM_SIZE):
+            draw = mask & (self.room_count < ROOM_SIZE) & (self.head < self.deck_end)
+            if not draw.any():
+                break
+            rows = self.rows[draw]
+            self.room[rows, self.room_count[rows]] = self.deck[rows, self.head[rows]]
+            self.room_count[rows] += 1
+            self.head[rows] += 1
+
+    def legal_mask(self):
+        """(N, 5) booleans: which room indices and AVOID_ROOM each game allows"""
+        mask = np.zeros((self.size, AVOID_ROOM + 1), dtype=bool)
+        mask[:, :ROOM_SIZE] = np.arange(ROOM_SIZE) < self.room_count[:, None]
+        mask[:, AVOID_ROOM] = ~self.avoided & (self.chosen == 0)
+        mask[self.over] = False
+        return mask
+
+    def step(self, actions):
+        """Play one action in every game that is not over.
+
+        actions holds a room index or AVOID_ROOM per game; entries for games
+        that are over are ignored. Raises ValueError if a game is given an
+        action that Game.legal_actions would not offer.
+        """
+        actions = np.asarray(actions)
+        active = ~self.over
+        legal = self.legal_mask()
+        chosen = actions[active]
+        if (chosen < 0).any() or (chosen > AVOID_ROOM).any() or \
+                not legal[self.rows[active], chosen].all():
+            raise ValueError("Illegal action for a game in the batch")
+        self.actions[active, self.action_count[active]] = actions[active]
+        self.action_count[active] += 1
+
+        avoid = active & (actions == AVOID_ROOM)
+        if avoid.any():
+            self._avoid(avoid)
+        select = active & (actions != AVOID_ROOM)
+        if select.any():
+            self._select(select, actions)
+
+        self.over |= (self.health <= 0) | ((self.head >= self.deck_end) & (self.room_count == 0))
+
+    def _avoid(self, mask):
+        # Room cards go to the bottom of the deck in room order
+        rows = self.rows[mask]
+        for slot in range(ROOM_SIZE):
+            moved = rows[self.room_count[rows] > slot]
+            self.deck[moved, self.deck_end[moved]] = self.room[moved, slot]
+            self.deck_end[moved] += 1
+        self.room[rows] = EMPTY
+        self.room_count[rows] = 0
+        self._fill_room(mask)
+        self.avoided[rows] = True
+        self.room_number[rows] += 1
+        self.chosen[rows] = 0
+        self.used_potion[rows] = False
+
+    def _select(self, mask, actions):
+        rows = self.rows[mask]
+        index = actions[rows].astype(np.intp)
+        card = self.room[rows, index]
+        # Close the gap the card leaves in the room
+        slots = np.arange(ROOM_SIZE)
+        source = np.where(slots >= index[:, None], slots + 1, slots)
+        padded = np.concatenate([self.room[rows], np.full((len(rows), 1), EMPTY, np.int8)], axis=1)
+        self.room[rows] = np.take_along_axis(padded, source, axis=1)
+        self.room_count[rows] -= 1
+        self.chosen[rows] += 1
+
+        kind = KIND[card]
+        value = VALUE[card]
+
+        weapon = kind == WEAPON
+        picked = rows[weapon]
+        # The old weapon and its slain monsters cover any potion on the discard pile
+        self.bonus[picked[self.weapon[picked] > 0]] = 0
+        self.weapon[picked] = value[weapon]
+        self.last_slain[picked] = 0
+
+        potion = kind == POTION
+        picked = rows[potion]
+        # A second potion in the same room is thrown away unused
+        drink = ~self.used_potion[picked]
+        picked, amount = picked[drink], value[potion][drink]
+        self.health[picked] = np.minimum(self.max_health, self.health[picked] + amount)
+        self.used_potion[picked] = True
+        self.bonus[picked] = amount
+
+        monster = kind == MONSTER
+        picked = rows[monster]
+        strength = value[monster]
+        weapon_value = self.weapon[picked]
+        slain = self.last_slain[picked]
+        armed = (weapon_value > 0) & ((slain == 0) | (strength <= slain))
+        damage = np.where(armed, np.maximum(0, strength - weapon_value), strength)
+        self.health[picked] = np.maximum(0, self.health[picked] - damage)
+        died = picked[self.health[picked] == 0]
+        self.death_room[died] = self.room_number[died]
+        self.last_slain[picked[armed]] = strength[armed]
+        self.bonus[picked[~armed]] = 0
+
+        # After 3 picks the last card stays and the room is refilled
+        done = rows[self.chosen[rows] >= 3]
+        if len(done):
+            refill = np.zeros(self.size, dtype=bool)
+            refill[done] = True
+            self._fill_room(refill)
+            self.chosen[done] = 0
+            self.used_potion[done] = False
+            self.avoided[done] = False
+            self.room_number[done] += 1
+
+    def run(self, policy):
+        """Play every game to the end, asking policy(batch) for each action"""
+        while not self.over.all():
+            self.step(policy(self))
+        return self.scores()
+
+    def in_deck(self):
+        """(N, MAX_DECK_POSITIONS) booleans: which deck positions hold a card still to draw"""
+        positions = np.arange(MAX_DECK_POSITIONS)
+        return (positions >= self.head[:, None]) & (positions < self.deck_end[:, None])
+
+    def scores(self, rows=None):
+        """Game.calculate_score for every game, or for the given rows"""
+        if rows is None:
+            rows = self.rows
+        positions = np.arange(MAX_DECK_POSITIONS)
+        in_deck = (positions >= self.head[rows, None]) & (positions < self.deck_end[rows, None])
+        cards = np.where(in_deck, self.deck[rows], 0)
+        monsters = np.where(in_deck & (KIND[cards] == MONSTER), VALUE[cards], 0).sum(axis=1)
+        health = self.health[rows]
+        bonus = self.bonus[rows]
+        cleared = (self.head[rows] >= self.deck_end[rows]) & (self.room_count[rows] == 0)
+        full = (health == self.max_health) & (bonus > 0)
+        return np.where(health <= 0, -monsters,
+                        np.where(cleared & full, health + bonus, health))
+
+
+def first_card_policy(batch):
+    """Always take the first card in the room"""
+    return np.zeros(batch.size, dtype=np.intp)
+
+
+def random_policy(batch):
+    """Pick uniformly among the legal actions.
+
+    The choices are a hash of each game's seed and move number, so a game
+    plays the same however the seeds are split into batches.
+    """
+    z = batch.seeds.astype(np.uint64) * np.uint64(MAX_ACTIONS) + batch.action_count.astype(np.uint64)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    legal = batch.legal_mask()
+    choice = ((z >> np.uint64(32)) * legal.sum(axis=1).astype(np.uint64)) >> np.uint64(32)
+    # The choice-th legal action: the first whose running count passes it
+    return np.argmax(np.cumsum(legal, axis=1) > choice[:, None].astype(np.intp), axis=1)
+
+
+def greedy_policy(batch):
+    """Take the card that helps most (or hurts least) right now, never avoiding"""
+    room = np.maximum(batch.room, 0)
+    kind = KIND[room]
+    value = VALUE[room].astype(np.int16)
+    weapon = batch.weapon[:, None].astype(np.int16)
+    slain = batch.last_slain[:, None]
+    armed = (weapon > 0) & ((slain == 0) | (value <= slain))
+    damage = np.where(armed, np.maximum(0, value - weapon), value)
+    heal = np.where(batch.used_potion[:, None], 0,
+                    np.minimum(value, batch.max_health - batch.health[:, None]))
+    gain = np.select([kind == POTION, kind == WEAPON],
+                     [heal, np.maximum(0, value - weapon)], -damage)
+    gain[np.arange(ROOM_SIZE) >= batch.room_count[:, None]] = np.iinfo(np.int16).min
+    return np.argmax(gain, axis=1)
+
+
+POLICIES = {
+    "first": first_card_policy,
+    "greedy": greedy_policy,
+    "random": random_policy,
+}
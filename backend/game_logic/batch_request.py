@@ -0,0 +1,41 @@
+"""The body of POST /batch and its limits.
+
+app.py runs batches, and router.py splits them across shards. Both check a
+batch against the same limits, so the router can refuse one that is too big
+as a whole before any shard has started on its part.
+"""
+from pydantic import BaseModel
+
+MAX_BATCH_OPERATIONS = 10000
+MAX_BATCH_GAMES = 10000
+MAX_BATCH_ACTIONS = 100000
+
+
+class BatchOperation(BaseModel):
+    # "create": start count games, with difficulty or challenge as in /new-game
+    # "play": play actions (as in Game.apply) in order on game_id
+    op: str
+    count: int = 1
+    difficulty: str = None
+    challenge: str = None
+    game_id: str = None
+    actions: list[int] = []
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+    # Answer with the final state of every game touched instead of a result
+    # per operation
+    final_only: bool = False
+
+
+def check_limits(batch):
+    """Raise ValueError if a BatchRequest is over any of the limits"""
+    operations = batch.operations
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise ValueError(f"At most {MAX_BATCH_OPERATIONS} operations per batch")
+    if sum(max(operation.count, 0) for operation in operations
+           if operation.op == "create") > MAX_BATCH_GAMES:
+        raise ValueError(f"At most {MAX_BATCH_GAMES} new games per batch")
+    if sum(len(operation.actions) for operation in operations) > MAX_BATCH_ACTIONS:
+        raise ValueError(f"At most {MAX_BATCH_ACTIONS} actions per batch")
@@ -0,0 +1,103 @@
+"""The game as the player sees it: which cards are left, but not their order.
+
+A belief state is the solver's compact state with the unseen part of the deck
+kept as a sorted tuple of card codes instead of a sequence:
+
+    (unknown, bottom, room, health, weapon, limit, bonus, avoided, chosen, used)
+
+Cards placed at the bottom by avoiding a room were seen, so bottom keeps
+their order. They are drawn only once every unknown card is gone.
+"""
+from collections import Counter
+from math import comb
+from .solver import WEAPON, NO_LIMIT, card_code
+
+
+def belief_state(game):
+    """The belief state for a live game"""
+    deck = game.deck
+    player = game.player
+    bottom = deck.bottom[max(0, deck.head - len(deck.dealt)):]
+    limit = player.slain_monsters[-1].true_value if player.slain_monsters else NO_LIMIT
+    top = game.discard_pile[-1] if game.discard_pile else None
+    return (
+        tuple(sorted(card_code(card) for card in deck.dealt[deck.head:])),
+        tuple(card_code(card) for card in bottom),
+        tuple(card_code(card) for card in game.current_room),
+        player.health,
+        player.equipped_weapon.true_value if player.equipped_weapon else 0,
+        limit,
+        top.true_value if top is not None and top.type == "potion" else 0,
+        game.avoided_previous_room,
+        game.cards_chosen_this_room,
+        player.used_potion_this_turn,
+    )
+
+
+def draws(unknown, bottom, count):
+    """Every way to draw count cards.
+
+    Returns a list of (probability, drawn, unknown, bottom) with the cards
+    drawn from the unknown ones sorted, followed by any taken from the
+    bottom, and what is left of both.
+    """
+    taken = min(count, len(unknown))
+    extra = bottom[:count - taken]
+    bottom = bottom[count - taken:]
+    if taken == len(unknown):
+        return [(1.0, unknown + extra, (), bottom)]
+
+    groups = sorted(Counter(unknown).items())
+    total = comb(len(unknown), taken)
+    results = []
+
+    def pick(index, need, drawn, left, ways):
+        if not need:
+            for code, number in groups[index:]:
+                left += (code,) * number
+            results.append((ways / total, drawn + extra, left, bottom))
+            return
+        if index == len(groups):
+            return
+        code, number = groups[index]
+        for k in range(min(number, need) + 1):
+            pick(index + 1, need - k, drawn + (code,) * k,
+                 left + (code,) * (number - k), ways * comb(number, k))
+
+    pick(0, taken, (), (), 1)
+    return results
+
+
+def sample_draws(unknown, bottom, count, rng, samples):
+    """Like draws, but samples equally weighted draws with rng"""
+    taken = min(count, len(unknown))
+    extra = bottom[:count - taken]
+    bottom = bottom[count - taken:]
+    results = []
+    for _ in range(samples):
+        left = list(unknown)
+        rng.shuffle(left)
+        results.append((1 / samples, tuple(sorted(left[:taken])) + extra,
+                        tuple(sorted(left[taken:])), bottom))
+    return results
+
+
+def death_score(unknown, bottom, refill):
+    """Expected score for dying now, after refill cards are drawn.
+
+    The score counts the monsters left in the deck, and each unknown card
+    is equally likely to be among those drawn.
+    """
+    unseen = sum(code for code in unknown if code < WEAPON)
+    monsters = unseen + sum(code for code in bottom if code < WEAPON)
+    if refill:
+        taken = min(refill, len(unknown))
+        if taken:
+            monsters -= unseen * taken / len(unknown)
+        monsters -= sum(code for code in bottom[:refill - taken] if code < WEAPON)
+    return -monsters
+
+
+def final_score(health, bonus, max_health):
+    """Score for clearing the dungeon, as in Game.calculate_score"""
+    return health + bonus if health == max_health and bonus else health
@@ -1,33 +1,104 @@
+SUITS = ["clubs", "spades", "diamonds", "hearts"]
+VALUES = list(range(2, 11)) + [11, 12, 13, 14]  # 2-10, J, Q, K, A
+
+SUIT_TYPES = {
+    "clubs": "monster",
+    "spades": "monster",
+    "diamonds": "weapon",
+    "hearts": "potion",
+}
+
+
 class Card:
-    def __init__(self, suit, value):
-        self.suit = suit
-        self.value = value
-        
+    """A Scoundrel card.
+
+    Cards never change, so there is exactly one instance of each legal card
+    (see ``CARDS``). ``Card(suit, value)`` returns that shared instance, and
+    its type, true value and JSON form are worked out once at import time.
+    """
+
+    __slots__ = ("suit", "value", "id", "type", "true_value", "_dict")
+
+    def __new__(cls, suit, value):
+        try:
+            return _CARDS_BY_KEY[suit, value]
+        except KeyError:
+            raise ValueError(f"{value} of {suit} is not a Scoundrel card") from None
+
+    @classmethod
+    def _create(cls, card_id, suit, value):
+        card = object.__new__(cls)
+        card_type = SUIT_TYPES[suit]
+        setattr_ = object.__setattr__
+        setattr_(card, "id", card_id)
+        setattr_(card, "suit", suit)
+        setattr_(card, "value", value)
+        setattr_(card, "type", card_type)
+        setattr_(card, "true_value", value)
+        setattr_(card, "_dict", {
+            "suit": suit,
+            "value": value,
+            "type": card_type,
+            "true_value": value,
+        })
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
+
+    def __reduce__(self):
+        return Card, (self.suit, self.value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return f"Card({self.suit!r}, {self.value})"
+
     def get_card_type(self):
-        if self.suit in ["clubs", "spades"]:
-            return "monster"
-        elif self.suit == "diamonds":
-            return "weapon"
-        elif self.suit == "hearts":
-            return "potion"
-            
+        return self.type
+
     def get_value(self):
         """Get the true value of the card, accounting for face cards and aces"""
-        if self.get_card_type() == "monster":
-            if self.value == 1:  # Ace
-                return 14
-            elif self.value == 11:  # Jack
-                return 11
-            elif self.value == 12:  # Queen
-                return 12
-            elif self.value == 13:  # King
-                return 13
-        return self.value
-            
+        return self.true_value
+
     def to_dict(self):
-        return {
-            "suit": self.suit,
-            "value": self.value,
-            "type": self.get_card_type(),
-            "true_value": self.get_value()
-        }
\ No newline at end of file
+        """JSON form of the card. The dict is shared, so treat it as read-only."""
+        return self._dict
+
+
+def _build_cards():
+    cards = []
+    for suit in SUITS:
+        for value in VALUES:
+            # Skip red face cards and red aces as per rules
+            if suit in ["hearts", "diamonds"] and value > 10:
+                continue
+            cards.append(Card._create(len(cards), suit, value))
+    return tuple(cards)
+
+
+# The 44 legal cards, indexed by ``Card.id``
+CARDS = _build_cards()
+_CARDS_BY_KEY = {(card.suit, card.value): card for card in CARDS}
+
+
+def pack_cards(cards, size):
+    """Pack cards as 6-bit ids into ``size`` bytes, first card in the high bits"""
+    bits = 0
+    for card in cards:
+        bits = (bits << 6) | card.id
+    return (bits << (size * 8 - 6 * len(cards))).to_bytes(size, "big")
+
+
+def unpack_cards(data, count):
+    """Inverse of ``pack_cards``: read ``count`` cards back from ``data``"""
+    bits = int.from_bytes(data, "big") >> (len(data) * 8 - 6 * count)
+    cards = [None] * count
+    for i in range(count - 1, -1, -1):
+        cards[i] = CARDS[bits & 0x3F]
+        bits >>= 6
+    return cards
@@ -1,31 +1,87 @@
+import hashlib
 import random
-from .card import Card
+from datetime import datetime, timezone
+from functools import lru_cache
+from .card import CARDS
+
+_MASK = (1 << 64) - 1
+
+
+def deal_order(seed):
+    """Card ids in the order a deck seeded with seed is dealt.
+
+    This is a Fisher-Yates shuffle driven by a SplitMix64 stream, so the
+    batch engine can deal the same decks with NumPy.
+    """
+    ids = list(range(len(CARDS)))
+    state = int(seed) & _MASK
+    for i in range(len(ids) - 1, 0, -1):
+        state = (state + 0x9E3779B97F4A7C15) & _MASK
+        z = ((state ^ (state >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+        z ^= z >> 31
+        j = ((z >> 32) * (i + 1)) >> 32
+        ids[i], ids[j] = ids[j], ids[i]
+    return ids
+
+
+@lru_cache(maxsize=256)
+def shared_deal(seed):
+    """The dealt cards for seed as one tuple shared by every deck with that seed"""
+    return tuple(CARDS[i] for i in deal_order(seed))
+
+
+def daily_seed(day=None):
+    """Seed of the daily challenge for a date, today in UTC by default"""
+    day = day or datetime.now(timezone.utc).date()
+    digest = hashlib.sha256(f"scoundrel-daily-{day.isoformat()}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
 
 class Deck:
-    def __init__(self):
-        self.cards = []
-        self.initialize_deck()
-        
-    def initialize_deck(self):
-        suits = ["clubs", "spades", "diamonds", "hearts"]
-        values = list(range(2, 11)) + [11, 12, 13, 14]  # 2-10, J, Q, K, A
-        
-        for suit in suits:
-            for value in values:
-                # Skip red face cards and red aces as per rules
-                if suit in ["hearts", "diamonds"] and value in [11, 12, 13, 14]:
-                    continue
-                self.cards.append(Card(suit, value))
-                
-        random.shuffle(self.cards)
-        
+    # Seeded decks share their dealt tuple, so a deck is only these fields
+    __slots__ = ("dealt", "bottom", "head")
+
+    def __init__(self, seed=None):
+        # The dealt order never changes: drawing moves `head` forward and
+        # avoided rooms are appended to `bottom`, so every change is cheap
+        # to undo.
+        self.dealt = ()
+        self.bottom = []
+        self.head = 0
+        self.initialize_deck(seed)
+
+    def initialize_deck(self, seed=None):
+        # Deal from the shared card table instead of building new cards
+        if seed is None:
+            cards = list(CARDS)
+            random.shuffle(cards)
+            self.dealt = tuple(cards)
+        else:
+            self.dealt = shared_deal(int(seed))
+        self.bottom = []
+        self.head = 0
+
+    @property
+    def cards(self):
+        """Cards left in the deck, top first"""
+        if self.head < len(self.dealt):
+            return list(self.dealt[self.head:]) + self.bottom
+        return self.bottom[self.head - len(self.dealt):]
+
     def draw_card(self):
-        if not self.cards:
+        head = self.head
+        if head < len(self.dealt):
+            card = self.dealt[head]
+        elif head - len(self.dealt) < len(self.bottom):
+            card = self.bottom[head - len(self.dealt)]
+        else:
             return None
-        return self.cards.pop(0)
-        
+        self.head = head + 1
+        return card
+
     def cards_remaining(self):
-        return len(self.cards)
-        
+        return len(self.dealt) + len(self.bottom) - self.head
+
     def place_at_bottom(self, cards):
-        self.cards.extend(cards)
\ No newline at end of file
+        self.bottom.extend(cards)
@@ -0,0 +1,122 @@
+"""Compare two batch policies on the same shuffles.
+
+    python -m game_logic.evaluate greedy random --max-games 1000000
+
+Both policies play every seed, so the luck of the deal cancels out of the
+per-game score difference. Games are played in chunks on a process pool
+and folded into the running statistics in seed order, so the outcome only
+depends on the seeds and policies.
+
+After each chunk a confidence sequence for the mean difference is updated:
+unlike a fixed-sample interval it holds at every chunk at once, so the run
+can stop as soon as it excludes zero without inflating the error rate. The
+boundary is the normal mixture one with the sample variance plugged in
+(an asymptotic confidence sequence).
+"""
+import argparse
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .batch import POLICIES, BatchGame
+
+DEFAULT_CHUNK = 10000
+DEFAULT_MAX_GAMES = 1000000
+# Number of games at which the confidence sequence is tightest
+DEFAULT_TUNING = 100000
+
+
+def play_pair(policy_a, policy_b, start, stop):
+    """Play seeds start..stop-1 with both policies.
+
+    Returns (games, total a, total b, mean difference, sum of squared
+    deviations of the difference) with differences taken as a - b.
+    """
+    seeds = np.arange(start, stop, dtype=np.uint64)
+    scores_a = BatchGame(seeds).run(POLICIES[policy_a]).astype(np.int64)
+    scores_b = BatchGame(seeds).run(POLICIES[policy_b]).astype(np.int64)
+    difference = scores_a - scores_b
+    mean = difference.mean()
+    return len(seeds), int(scores_a.sum()), int(scores_b.sum()), mean, float(((difference - mean) ** 2).sum())
+
+
+def confidence_sequence(games, mean, variance, alpha, tuning=DEFAULT_TUNING):
+    """(low, high) bounds on the mean that hold at every number of games
+    with probability 1 - alpha"""
+    rho2 = (-2 * math.log(alpha) + math.log(-2 * math.log(alpha) + 1)) / tuning
+    scale = games * variance * rho2 + 1
+    radius = math.sqrt(2 * scale / (games * games * rho2) * math.log(math.sqrt(scale) / alpha))
+    return mean - radius, mean + radius
+
+
+def evaluate(policy_a, policy_b, start=0, max_games=DEFAULT_MAX_GAMES, alpha=0.05,
+             chunk=DEFAULT_CHUNK, workers=None, tuning=DEFAULT_TUNING):
+    """Play both policies on seeds from start until their difference is
+    significant at level alpha or max_games seeds have been played.
+
+    Returns a dict with the games played, each policy's mean score, the mean
+    difference (a - b), its confidence sequence bounds and whether the
+    run stopped because the difference was significant.
+    """
+    for policy in (policy_a, policy_b):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}")
+    chunks = [(start + offset, start + min(offset + chunk, max_games))
+              for offset in range(0, max_games, chunk)]
+
+    games = total_a = total_b = 0
+    mean = squares = 0.0
+    low, high = -math.inf, math.inf
+    with ProcessPoolExecutor(workers) as pool:
+        # Played in parallel, folded in seed order
+        results = pool.map(play_pair, [policy_a] * len(chunks), [policy_b] * len(chunks),
+                           *zip(*chunks)) if chunks else []
+        for count, sum_a, sum_b, chunk_mean, chunk_squares in results:
+            # Chan et al. update of the running mean and squared deviations
+            delta = chunk_mean - mean
+            combined = games + count
+            mean += delta * count / combined
+            squares += chunk_squares + delta * delta * games * count / combined
+            games = combined
+            total_a += sum_a
+            total_b += sum_b
+            low, high = confidence_sequence(games, mean, squares / games, alpha, tuning)
+            if low > 0 or high < 0:
+                pool.shutdown(cancel_futures=True)
+                break
+
+    return {
+        "games": games,
+        "mean_a": total_a / games if games else None,
+        "mean_b": total_b / games if games else None,
+        "difference": mean,
+        "low": low,
+        "high": high,
+        "significant": low > 0 or high < 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m game_logic.evaluate",
+                                     description="Compare two policies on the same seeds.")
+    parser.add_argument("policy_a", choices=sorted(POLICIES))
+    parser.add_argument("policy_b", choices=sorted(POLICIES))
+    parser.add_argument("--start", type=int, default=0, help="first seed")
+    parser.add_argument("--max-games", type=int, default=DEFAULT_MAX_GAMES)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="seeds per task")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    parser.add_argument("--tuning", type=int, default=DEFAULT_TUNING,
+                        help="games at which the confidence sequence is tightest")
+    args = parser.parse_args(argv)
+
+    result = evaluate(args.policy_a, args.policy_b, args.start, args.max_games, args.alpha,
+                      args.chunk, args.workers, args.tuning)
+    print(f"{result['games']} games: {args.policy_a} {result['mean_a']:.3f}, "
+          f"{args.policy_b} {result['mean_b']:.3f}")
+    print(f"difference {result['difference']:+.3f}, "
+          f"{1 - args.alpha:.0%} confidence sequence [{result['low']:+.3f}, {result['high']:+.3f}]")
+    print("significant" if result["significant"] else "not significant")
+
+
+if __name__ == "__main__":
+    main()
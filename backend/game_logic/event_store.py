@@ -0,0 +1,99 @@
+"""Games stored as their seed and action log.
+
+A Game is rebuilt from (seed, actions) with Game.replay, so the store keeps
+only those, plus the packed state (Game.to_bytes) every snapshot_interval
+actions. Loading a game starts from its latest snapshot and replays at most
+snapshot_interval - 1 actions on top.
+"""
+from .game import Game
+from .store import GameStore
+
+SNAPSHOT_INTERVAL = 16
+
+
+class GameLog:
+    __slots__ = ("seed", "challenge", "created", "actions", "snapshot")
+
+    def __init__(self, seed, challenge=None, created=None):
+        self.seed = seed
+        self.challenge = challenge
+        self.created = created
+        self.actions = bytearray()
+        # (actions covered, packed state, room number, rooms avoided) or None
+        self.snapshot = None
+
+    @classmethod
+    def of(cls, game):
+        """An empty log for a game created with a seed"""
+        if game.seed is None:
+            raise ValueError("Only seeded games can be rebuilt from their actions")
+        return cls(game.seed, game.challenge, game.created)
+
+    def record(self, game, snapshot_interval=SNAPSHOT_INTERVAL):
+        """Append the actions played on game that the log does not have.
+        Returns whether there were any. Raises ValueError if game was not
+        played on from this log, such as a copy loaded before another one
+        was recorded."""
+        if game.actions[:len(self.actions)] != self.actions:
+            raise ValueError("The game does not follow its stored log")
+        new = game.actions[len(self.actions):]
+        if not new:
+            return False
+        self.actions += new
+        count = len(self.actions)
+        if count // snapshot_interval > (self.snapshot[0] if self.snapshot else 0) // snapshot_interval:
+            self.snapshot = (count, game.to_bytes(), game.room_number, game.rooms_avoided)
+        return True
+
+    def game(self, game_id):
+        """Rebuild the game"""
+        if self.snapshot is None:
+            game = Game.replay(self.seed, self.actions, game_id, self.challenge)
+            game.created = self.created
+            return game
+        count, packed, room_number, rooms_avoided = self.snapshot
+        game = Game.from_bytes(packed, game_id)
+        game.seed = self.seed
+        game.challenge = self.challenge
+        game.created = self.created
+        game.actions = self.actions[:count]
+        game.room_number = room_number
+        game.rooms_avoided = rooms_avoided
+        game.version = count
+        for action in self.actions[count:]:
+            game.apply(action)
+        return game
+
+
+class EventStore(GameStore):
+    """GameLogs in a dict, keyed by game id"""
+
+    def __init__(self, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.logs = {}
+
+    def __contains__(self, game_id):
+        return game_id in self.logs
+
+    def __len__(self):
+        return len(self.logs)
+
+    def add(self, game):
+        log = self.logs[game.id] = GameLog.of(game)
+        log.record(game, self.snapshot_interval)
+
+    def record(self, game):
+        self.logs[game.id].record(game, self.snapshot_interval)
+
+    def load(self, game_id):
+        return self.logs[game_id].game(game_id)
+
+    def version(self, game_id):
+        # Every action bumps the version once
+        return len(self.logs[game_id].actions)
+
+    def delete(self, game_id):
+        del self.logs[game_id]
+
+    def created_times(self):
+        return [(game_id, log.created) for game_id, log in self.logs.items()]
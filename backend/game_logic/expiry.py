@@ -0,0 +1,217 @@
+"""Expire idle and old games from a GameStore.
+
+ExpiringStore wraps another store and drops a game when it has not been
+used for idle_ttl seconds, when it is max_age seconds old, or when more than
+max_games are live (least recently used first). Deadlines sit in a
+TimingWheel, so a reaper thread expires games with work proportional to
+the games due, never by scanning them all.
+
+With a spill store, games that go idle or fall out of the LRU are moved
+there instead of being dropped, and loading one moves it back. Games past
+max_age are dropped from both, and the spill store is purged of them every
+purge_interval seconds. Games the inner store already holds when this one
+is made (a database from an earlier run) are adopted as live then, as if
+just used; owns picks which of them to adopt when several servers share
+the database. Games created by another server later become live when
+first loaded.
+"""
+import threading
+import time
+from collections import OrderedDict
+from .store import GameStore
+
+IDLE_TTL = 3600
+MAX_AGE = 86400
+MAX_GAMES = 100000
+TICK = 1.0
+WHEEL_SLOTS = 4096
+PURGE_INTERVAL = 60
+
+
+class TimingWheel:
+    """Keys with deadlines, hashed into slots by tick.
+
+    Scheduling and cancelling are O(1). advance() visits one slot per tick
+    passed, and a slot only holds the keys due in that tick of some turn of
+    the wheel.
+    """
+
+    def __init__(self, tick=TICK, slots=WHEEL_SLOTS, now=0.0):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.where = {}  # key -> (slot, tick it is due)
+        self.current = int(now // tick)  # last tick advanced to
+
+    def __len__(self):
+        return len(self.where)
+
+    def schedule(self, key, deadline):
+        """(Re)schedule key to expire at deadline"""
+        self.cancel(key)
+        # Round up, so keys never expire early
+        due = max(-int(-deadline // self.tick), self.current + 1)
+        slot = due % len(self.slots)
+        self.slots[slot].add(key)
+        self.where[key] = (slot, due)
+
+    def cancel(self, key):
+        entry = self.where.pop(key, None)
+        if entry is not None:
+            self.slots[entry[0]].discard(key)
+
+    def advance(self, now):
+        """Remove and return the keys due by now"""
+        target = int(now // self.tick)
+        if target <= self.current:
+            return []
+        if target - self.current >= len(self.slots):
+            # A whole turn or more passed: every slot is due
+            slots = range(len(self.slots))
+        else:
+            slots = (tick % len(self.slots) for tick in range(self.current + 1, target + 1))
+        expired = []
+        for slot in slots:
+            keys = self.slots[slot]
+            due = [key for key in keys if self.where[key][1] <= target]
+            for key in due:
+                keys.discard(key)
+                del self.where[key]
+            expired.extend(due)
+        self.current = target
+        return expired
+
+
+class ExpiringStore(GameStore):
+    def __init__(self, inner, spill=None, idle_ttl=IDLE_TTL, max_age=MAX_AGE,
+                 max_games=MAX_GAMES, tick=TICK, purge_interval=PURGE_INTERVAL,
+                 clock=time.time, reap=True, owns=None):
+        self.inner = inner
+        self.spill = spill
+        self.idle_ttl = idle_ttl
+        self.max_age = max_age
+        self.max_games = max_games
+        self.purge_interval = purge_interval
+        self.clock = clock
+        # Live game ids, least recently used first, with their creation times
+        self.live = OrderedDict()
+        self.wheel = TimingWheel(tick, now=clock())
+        self.lock = threading.RLock()
+        self._last_purge = clock()
+        self._stop = threading.Event()
+        self._reaper = None
+        for game_id, created in sorted(inner.created_times(), key=lambda item: item[1]):
+            if owns is None or owns(game_id):
+                self._touch(game_id, created)
+        if reap:
+            self._reaper = threading.Thread(target=self._reap_loop, args=(tick,),
+                                            name="game-reaper", daemon=True)
+            self._reaper.start()
+
+    def _touch(self, game_id, created):
+        now = self.clock()
+        self.live[game_id] = created
+        self.live.move_to_end(game_id)
+        self.wheel.schedule(game_id, min(now + self.idle_ttl, created + self.max_age))
+        while len(self.live) > self.max_games:
+            self._evict(next(iter(self.live)), now)
+
+    def _evict(self, game_id, now):
+        created = self.live.pop(game_id)
+        self.wheel.cancel(game_id)
+        if self.spill is not None and now < created + self.max_age:
+            self.spill.add(self.inner.load(game_id))
+        self.inner.delete(game_id)
+
+    def __contains__(self, game_id):
+        with self.lock:
+            return (game_id in self.live or game_id in self.inner
+                    or (self.spill is not None and game_id in self.spill))
+
+    def add(self, game):
+        with self.lock:
+            self.inner.add(game)
+            self._touch(game.id, game.created)
+
+    def load(self, game_id):
+        with self.lock:
+            if game_id in self.live:
+                game = self.inner.load(game_id)
+            else:
+                game = self._revive(game_id)
+            self._touch(game_id, game.created)
+            return game
+
+    def version(self, game_id):
+        with self.lock:
+            if game_id not in self.live:
+                return self.load(game_id).version
+            self._touch(game_id, self.live[game_id])
+            return self.inner.version(game_id)
+
+    def _revive(self, game_id):
+        """Make a game that is not live live again"""
+        if game_id in self.inner:
+            game = self.inner.load(game_id)
+            if self.clock() >= game.created + self.max_age:
+                self.inner.delete(game_id)
+                raise KeyError(game_id)
+        else:
+            if self.spill is None:
+                raise KeyError(game_id)
+            game = self.spill.load(game_id)
+            self.spill.delete(game_id)
+            if self.clock() >= game.created + self.max_age:
+                raise KeyError(game_id)
+            self.inner.add(game)
+        self.live[game_id] = game.created
+        return game
+
+    def created_times(self):
+        with self.lock:
+            times = list(self.live.items())
+            if self.spill is not None:
+                times += self.spill.created_times()
+            return times
+
+    def record(self, game):
+        with self.lock:
+            if game.id not in self.live:
+                self._revive(game.id)
+            self.inner.record(game)
+            self._touch(game.id, game.created)
+
+    def delete(self, game_id):
+        with self.lock:
+            if game_id in self.live:
+                del self.live[game_id]
+                self.wheel.cancel(game_id)
+                self.inner.delete(game_id)
+            elif self.spill is not None:
+                self.spill.delete(game_id)
+            else:
+                raise KeyError(game_id)
+
+    def reap(self):
+        """Expire the games that are due. Returns how many there were."""
+        with self.lock:
+            now = self.clock()
+            expired = self.wheel.advance(now)
+            for game_id in expired:
+                self._evict(game_id, now)
+            if self.spill is not None and now - self._last_purge >= self.purge_interval:
+                self.spill.purge(now - self.max_age)
+                self._last_purge = now
+            return len(expired)
+
+    def _reap_loop(self, tick):
+        while not self._stop.wait(tick):
+            self.reap()
+
+    def close(self):
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+        self.inner.close()
+        if self.spill is not None:
+            self.spill.close()
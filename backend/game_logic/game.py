@@ -1,34 +1,91 @@
+import secrets
+import struct
+import time
 import uuid
+from collections import deque
+from .card import CARDS, pack_cards, unpack_cards
 from .deck import Deck
 from .player import Player
+from .zobrist import (
+    AVOIDED_KEY, CHOSEN_KEYS, DECK_KEYS, DISCARD_KEYS, HEALTH_KEYS,
+    POTION_USED_KEY, ROOM_KEYS, SLAIN_KEYS, WEAPON_KEYS,
+)
+
+# Packed state layout (see Game.to_bytes): an 11 byte header followed by the
+# deck, room, slain monsters and discard pile as 6-bit card ids.
+STATE_SIZE = 64
+STATE_VERSION = 2
+_STATE_HEADER = struct.Struct(">BbBBBBBBBBB")
+_NO_CARD = 0xFF
+
+# Actions for Game.apply: 0-3 select that room card, AVOID_ROOM avoids the room
+AVOID_ROOM = 4
+
+# How many versions back Game.get_patch can go
+CHANGE_HISTORY = 16
+# get_state() fields that get_patch sends when they change, in _view() order
+_PATCH_FIELDS = (
+    "health", "max_health", "equipped_weapon", "cards_remaining",
+    "avoided_previous_room", "used_potion_this_turn", "cards_chosen_this_room",
+)
 
 class Game:
-    def __init__(self):
+    def __init__(self, seed=None, challenge=None):
         self.id = str(uuid.uuid4())
-        self.deck = Deck()
+        # The deck order follows from the seed (see deck.deal_order), so the
+        # seed and the action log are enough to rebuild the game
+        if seed is None:
+            seed = secrets.randbits(64)
+        self.seed = seed
+        self.actions = bytearray()
+        self.created = time.time()
+        # Games of the same challenge share a seed, so their scores compare
+        self.challenge = challenge
+        self.deck = Deck(seed)
         self.player = Player()
         self.current_room = []
         self.discard_pile = []
         self.avoided_previous_room = False
         self.cards_chosen_this_room = 0
+        # Rooms entered and avoided so far, for statistics
+        self.room_number = 1
+        self.rooms_avoided = 0
+        self.hash = 0
+        # Bumped by every change to the game, so caches can tell states apart
+        self.version = 0
+        # (version, _view() at that version) before each of the latest changes
+        self.changes = deque(maxlen=CHANGE_HISTORY)
+        self._win_probability = None
         self.initialize_room()
+        self.hash = self.compute_hash()
         
     def initialize_room(self):
         """Start with a fresh room of 4 cards"""
         self.current_room = []
-        while len(self.current_room) < 4 and self.deck.cards_remaining() > 0:
-            self.current_room.append(self.deck.draw_card())
+        self._fill_room()
         self.cards_chosen_this_room = 0
         self.player.used_potion_this_turn = False
+        
+    def _fill_room(self):
+        """Draw cards until the room holds 4 or the deck runs out"""
+        deck = self.deck
+        while len(self.current_room) < 4 and deck.cards_remaining() > 0:
+            position = deck.head
+            card = deck.draw_card()
+            self.current_room.append(card)
+            self.hash ^= DECK_KEYS[position][card.id] ^ ROOM_KEYS[card.id]
             
     def select_card(self, index):
         """Select a card from the current room"""
         if index < 0 or index >= len(self.current_room):
             raise ValueError("Invalid card index")
             
+        self.changes.append((self.version, self._view()))
+        self.hash ^= self._flags_key()
         card = self.current_room.pop(index)
+        self.hash ^= ROOM_KEYS[card.id]
         self.cards_chosen_this_room += 1
-        card_type = card.get_card_type()
+        card_type = card.type
         
         if card_type == "weapon":
             self.handle_weapon(card)
@@ -46,16 +103,20 @@ class Game:
                 self.current_room.append(remaining_card)
                 
             # Draw new cards
-            while len(self.current_room) < 4 and self.deck.cards_remaining() > 0:
-                self.current_room.append(self.deck.draw_card())
+            self._fill_room()
                 
             # Reset room state
             self.cards_chosen_this_room = 0
             self.player.used_potion_this_turn = False
             self.avoided_previous_room = False
+            self.room_number += 1
+        self.hash ^= self._flags_key()
+        self.version += 1
+        self.actions.append(index)
                 
     def handle_weapon(self, card):
         """Handle equipping a weapon"""
+        self.hash ^= self._piles_key()
         # Discard old weapon if exists
         if self.player.equipped_weapon:
             self.discard_pile.append(self.player.equipped_weapon)
@@ -64,19 +125,23 @@ class Game:
                 self.discard_pile.append(monster)
                 
         self.player.equip_weapon(card)
+        self.hash ^= self._piles_key()
         
     def handle_potion(self, card):
         """Handle using a potion"""
+        self.hash ^= HEALTH_KEYS[self.player.health] ^ self._piles_key()
         if self.player.use_potion(card):
             self.discard_pile.append(card)
+        self.hash ^= HEALTH_KEYS[self.player.health] ^ self._piles_key()
         
     def handle_monster(self, card):
         """Handle fighting a monster"""
+        self.hash ^= HEALTH_KEYS[self.player.health] ^ self._piles_key()
         damage = self.player.fight_monster(card)
         self.player.take_damage(damage)
         if self.player.equipped_weapon:
             # If fought with weapon, add to monster stack
-            if damage < card.get_value():
+            if damage < card.true_value:
                 self.player.slain_monsters.append(card)
             else:
                 # If fought barehanded or weapon couldn't be used
@@ -84,27 +149,78 @@ class Game:
         else:
             # If fought barehanded
             self.discard_pile.append(card)
+        self.hash ^= HEALTH_KEYS[self.player.health] ^ self._piles_key()
         
     def avoid_room(self):
         """Avoid the current room"""
         if self.avoided_previous_room:
             raise ValueError("Cannot avoid two rooms in a row")
+        if self.cards_chosen_this_room > 0:
+            raise ValueError("Cannot avoid a room after choosing from it")
             
+        self.changes.append((self.version, self._view()))
+        self.hash ^= self._flags_key()
         # Place all room cards at bottom of deck
+        position = len(self.deck.dealt) + len(self.deck.bottom)
+        for card in self.current_room:
+            self.hash ^= ROOM_KEYS[card.id] ^ DECK_KEYS[position][card.id]
+            position += 1
         self.deck.place_at_bottom(self.current_room)
         self.current_room = []
         
         # Draw new room
-        while len(self.current_room) < 4 and self.deck.cards_remaining() > 0:
-            self.current_room.append(self.deck.draw_card())
+        self._fill_room()
             
         self.avoided_previous_room = True
         self.cards_chosen_this_room = 0
+        self.room_number += 1
+        self.rooms_avoided += 1
         self.player.used_potion_this_turn = False
+        self.hash ^= self._flags_key()
+        self.version += 1
+        self.actions.append(AVOID_ROOM)
+        
+    def _piles_key(self):
+        """Zobrist key for the weapon and the tops of the slain and discard piles"""
+        player = self.player
+        key = 0
+        if player.equipped_weapon:
+            key ^= WEAPON_KEYS[player.equipped_weapon.id]
+        if player.slain_monsters:
+            key ^= SLAIN_KEYS[player.slain_monsters[-1].id]
+        if self.discard_pile:
+            key ^= DISCARD_KEYS[self.discard_pile[-1].id]
+        return key
+        
+    def _flags_key(self):
+        """Zobrist key for the per-room counters"""
+        key = CHOSEN_KEYS[self.cards_chosen_this_room]
+        if self.avoided_previous_room:
+            key ^= AVOIDED_KEY
+        if self.player.used_potion_this_turn:
+            key ^= POTION_USED_KEY
+        return key
         
-    def get_state(self):
+    def compute_hash(self):
+        """Zobrist hash of the position, computed from scratch.
+
+        self.hash is kept equal to this as the game is played. Positions are
+        equal when health, weapon, the tops of the slain and discard piles,
+        the room counters, the remaining deck order and the room cards (in
+        any order) are.
+        """
+        deck = self.deck
+        key = HEALTH_KEYS[self.player.health] ^ self._piles_key() ^ self._flags_key()
+        order = deck.dealt + tuple(deck.bottom)
+        for position in range(deck.head, len(order)):
+            key ^= DECK_KEYS[position][order[position].id]
+        for card in self.current_room:
+            key ^= ROOM_KEYS[card.id]
+        return key
+        
+    def get_state(self, with_win_probability=False):
         """Get the current game state"""
-        return {
+        state = {
             "health": self.player.health,
             "max_health": self.player.max_health,
             "equipped_weapon": self.player.equipped_weapon.to_dict() if self.player.equipped_weapon else None,
@@ -114,23 +230,226 @@ class Game:
             "avoided_previous_room": self.avoided_previous_room,
             "used_potion_this_turn": self.player.used_potion_this_turn,
             "cards_chosen_this_room": self.cards_chosen_this_room,
-            "game_over": not self.player.is_alive() or (self.deck.cards_remaining() == 0 and len(self.current_room) == 0),
-            "score": self.calculate_score()
+            "game_over": self.is_over(),
+            "score": self.calculate_score(),
+            "version": self.version,
         }
+        if self.challenge is not None:
+            state["challenge"] = self.challenge
+        if with_win_probability:
+            state["win_probability"] = self.win_probability()
+        return state
+        
+    def _view(self):
+        """The parts of the state get_patch compares: the _PATCH_FIELDS, the
+        room cards, and the slain pile with its length (the pile only grows
+        until a new weapon replaces it)"""
+        player = self.player
+        return (player.health, player.max_health, player.equipped_weapon,
+                self.deck.cards_remaining(), self.avoided_previous_room,
+                player.used_potion_this_turn, self.cards_chosen_this_room,
+                tuple(self.current_room), player.slain_monsters, len(player.slain_monsters))
+        
+    def get_patch(self, since_version, with_win_probability=False):
+        """What changed since get_state() returned version since_version, or
+        None if that version is not among the last CHANGE_HISTORY.
+
+        "set" holds the fields that changed, and always game_over and score.
+        "room" lists the slots of the old room whose cards left it and the
+        cards that came in after the rest. "slain_monsters" says how many of
+        the old ones to keep and which to append after them.
+        """
+        if since_version == self.version:
+            old = self._view()
+        else:
+            changes = self.changes
+            first = changes[0][0] if changes else self.version
+            if not first <= since_version < self.version:
+                return None
+            version, old = changes[since_version - first]
+            if version != since_version:
+                return None
+        new = self._view()
+        changed = {name: after for name, before, after in zip(_PATCH_FIELDS, old, new)
+                   if before != after}
+        if "equipped_weapon" in changed:
+            weapon = changed["equipped_weapon"]
+            changed["equipped_weapon"] = weapon.to_dict() if weapon else None
+        changed["game_over"] = self.is_over()
+        changed["score"] = self.calculate_score()
+        if with_win_probability:
+            changed["win_probability"] = self.win_probability()
+        patch = {"since_version": since_version, "version": self.version, "set": changed}
+        old_room, room = old[7], new[7]
+        if old_room != room:
+            # Cards usually only leave the room or are drawn into the end of
+            # it. Avoiding a room near the end of the deck draws deck cards
+            # ahead of the avoided ones, so then the whole room is replaced.
+            removed = [slot for slot, card in enumerate(old_room) if card not in room]
+            kept = len(old_room) - len(removed)
+            if [card for card in old_room if card in room] != list(room[:kept]):
+                removed, kept = list(range(len(old_room))), 0
+            patch["room"] = {"remove": removed,
+                             "append": [card.to_dict() for card in room[kept:]]}
+        slain = self.player.slain_monsters
+        old_slain, old_count = old[8], old[9]
+        keep = old_count if old_slain is slain else 0
+        if not keep == old_count == len(slain):
+            patch["slain_monsters"] = {"keep": keep,
+                                       "append": [m.to_dict() for m in slain[keep:]]}
+        return patch
+        
+    def win_probability(self):
+        """Chance of clearing the dungeon with the best play, or None if that
+        is too costly to work out, as it is until late in the game (see
+        odds.py). Cached until the game changes."""
+        if self._win_probability is None or self._win_probability[0] != self.version:
+            # Imported here as odds builds on this module
+            from .odds import win_probability
+            self._win_probability = (self.version, win_probability(self))
+        return self._win_probability[1]
+        
+    def set_win_probability(self, probability):
+        """Cache a win_probability() worked out elsewhere, such as in a
+        worker process"""
+        self._win_probability = (self.version, probability)
+        
+    def is_over(self):
+        """The player is dead or has cleared the dungeon"""
+        return not self.player.is_alive() or (self.deck.cards_remaining() == 0 and len(self.current_room) == 0)
+        
+    def legal_actions(self):
+        """Actions allowed by the rules: each room index, plus AVOID_ROOM before the first pick"""
+        if self.is_over():
+            return []
+        actions = list(range(len(self.current_room)))
+        if not self.avoided_previous_room and self.cards_chosen_this_room == 0:
+            actions.append(AVOID_ROOM)
+        return actions
+        
+    def apply(self, action):
+        """Play an action and return a token that undo() uses to take it back"""
+        player = self.player
+        room = self.current_room
+        token = (
+            room, self.deck.head, len(self.deck.bottom), player.health,
+            player.equipped_weapon, player.slain_monsters, len(player.slain_monsters),
+            len(self.discard_pile), self.avoided_previous_room,
+            self.cards_chosen_this_room, player.used_potion_this_turn, self.hash,
+            self.room_number, self.rooms_avoided, len(self.actions),
+        )
+        # Play on a copy of the room so the token keeps the original
+        self.current_room = room[:]
+        try:
+            if action == AVOID_ROOM:
+                self.avoid_room()
+            else:
+                self.select_card(action)
+        except ValueError:
+            self.current_room = room
+            raise
+        return token
+        
+    def undo(self, token):
+        """Restore the state from before the apply() call that returned token.
+
+        Tokens must be undone in reverse order of the apply() calls. Every pile
+        only grew since then, so this just truncates them.
+        """
+        player = self.player
+        (self.current_room, self.deck.head, bottom_size, player.health,
+         player.equipped_weapon, slain, slain_size, discard_size,
+         self.avoided_previous_room, self.cards_chosen_this_room,
+         player.used_potion_this_turn, self.hash,
+         self.room_number, self.rooms_avoided, actions_size) = token
+        del self.deck.bottom[bottom_size:]
+        del slain[slain_size:]
+        player.slain_monsters = slain
+        del self.discard_pile[discard_size:]
+        del self.actions[actions_size:]
+        self.version += 1
+        # The recorded changes no longer lead here
+        self.changes.clear()
         
     def calculate_score(self):
         """Calculate the current game score"""
         if not self.player.is_alive():
             # If player died, calculate negative score
-            remaining_monsters = [c for c in self.deck.cards if c.get_card_type() == "monster"]
-            monster_values = sum(m.get_value() for m in remaining_monsters)
+            monster_values = sum(c.true_value for c in self.deck.cards if c.type == "monster")
             return -1 * (abs(self.player.health) + monster_values)
         elif self.deck.cards_remaining() == 0 and len(self.current_room) == 0:
             # If survived, score is remaining health
             # Plus potion value if last card was potion and health is max
             if (self.discard_pile and 
-                self.discard_pile[-1].get_card_type() == "potion" and 
+                self.discard_pile[-1].type == "potion" and 
                 self.player.health == self.player.max_health):
-                return self.player.health + self.discard_pile[-1].get_value()
+                return self.player.health + self.discard_pile[-1].true_value
             return self.player.health
-        return self.player.health  # Current score during game
\ No newline at end of file
+        return self.player.health  # Current score during game
+        
+    def to_bytes(self):
+        """Pack the game state into STATE_SIZE bytes. The id, seed, action log
+        and room counters are not packed."""
+        player = self.player
+        weapon = player.equipped_weapon
+        n_deck = self.deck.cards_remaining()
+        flags = self.avoided_previous_room | (player.used_potion_this_turn << 1)
+        header = _STATE_HEADER.pack(
+            STATE_VERSION, player.health, player.max_health, flags,
+            self.cards_chosen_this_room, weapon.id if weapon else _NO_CARD,
+            n_deck, min(n_deck, len(self.deck.bottom)), len(self.current_room),
+            len(player.slain_monsters), len(self.discard_pile),
+        )
+        cards = self.deck.cards + self.current_room + player.slain_monsters + self.discard_pile
+        return header + pack_cards(cards, STATE_SIZE - _STATE_HEADER.size)
+
+    @classmethod
+    def replay(cls, seed, actions, game_id=None, challenge=None):
+        """Rebuild a game from its seed and action log"""
+        game = cls(seed, challenge)
+        if game_id is not None:
+            game.id = game_id
+        for action in actions:
+            if action == AVOID_ROOM:
+                game.avoid_room()
+            else:
+                game.select_card(action)
+        return game
+
+    @classmethod
+    def from_bytes(cls, data, game_id=None):
+        """Rebuild a game packed by to_bytes. A new id is assigned unless given."""
+        if len(data) != STATE_SIZE or data[0] != STATE_VERSION:
+            raise ValueError("Not a packed game state")
+        (_, health, max_health, flags, chosen, weapon,
+         n_deck, n_bottom, n_room, n_slain, n_discard) = _STATE_HEADER.unpack_from(data)
+        cards = unpack_cards(data[_STATE_HEADER.size:], n_deck + n_room + n_slain + n_discard)
+
+        game = cls.__new__(cls)
+        game.id = game_id or str(uuid.uuid4())
+        game.seed = None
+        game.actions = bytearray()
+        game.created = time.time()
+        game.challenge = None
+        game.deck = Deck.__new__(Deck)
+        game.deck.dealt = tuple(cards[:n_deck - n_bottom])
+        game.deck.bottom = cards[n_deck - n_bottom:n_deck]
+        game.deck.head = 0
+        game.current_room = cards[n_deck:n_deck + n_room]
+        game.discard_pile = cards[n_deck + n_room + n_slain:]
+        game.avoided_previous_room = bool(flags & 1)
+        game.cards_chosen_this_room = chosen
+        game.room_number = 1
+        game.rooms_avoided = 0
+
+        player = game.player = Player()
+        player.health = health
+        player.max_health = max_health
+        player.equipped_weapon = CARDS[weapon] if weapon != _NO_CARD else None
+        player.slain_monsters = cards[n_deck + n_room:n_deck + n_room + n_slain]
+        player.used_potion_this_turn = bool(flags & 2)
+        game.hash = game.compute_hash()
+        game.version = 0
+        game.changes = deque(maxlen=CHANGE_HISTORY)
+        game._win_probability = None
+        return game
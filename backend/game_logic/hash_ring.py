@@ -0,0 +1,39 @@
+"""Consistent hashing of game ids onto shards.
+
+Each shard owns `replicas` points on a ring of 64-bit hashes, and a key
+belongs to the shard of the first point at or after the key's hash. Going
+from n to n + 1 shards only moves the keys that land on the new shard's
+points, about 1/(n + 1) of them; everything else keeps its owner.
+"""
+import uuid
+from bisect import bisect_left
+from hashlib import blake2b
+
+REPLICAS = 128
+
+
+def _hash(text):
+    return int.from_bytes(blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class HashRing:
+    def __init__(self, shards, replicas=REPLICAS):
+        if shards < 1:
+            raise ValueError("A ring needs at least one shard")
+        self.shards = shards
+        points = sorted((_hash(f"shard-{shard}-{replica}"), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def owner(self, key):
+        """The shard a key belongs to"""
+        index = bisect_left(self.points, _hash(key))
+        return self.owners[index % len(self.points)]
+
+    def new_key(self, shard):
+        """A fresh game id that belongs to shard"""
+        while True:
+            key = str(uuid.uuid4())
+            if self.owner(key) == shard:
+                return key
@@ -0,0 +1,164 @@
+"""Move suggestions for a live game.
+
+The hint engine runs an expectimax search over belief states: the player
+picks the best way through each room, and each refill is a chance node over
+the cards that could be drawn. Only the composition of the unseen deck is
+used, never its order. The search deepens one room at a time until it runs
+out of time, and the ranking from the deepest finished pass is returned.
+"""
+import random
+import time
+from math import comb
+from .belief import belief_state, death_score, draws, final_score, sample_draws
+from .game import AVOID_ROOM
+from .solver import POTION, WEAPON, play_card, play_room
+
+DEFAULT_BUDGET_MS = 200
+# Chance nodes with more possible draws than this are sampled instead
+MAX_DRAWS = 16
+MIN_DRAWS = 4
+# Weights in the estimate for positions past the search depth
+WEAPON_WORTH = 1
+POTION_WORTH = 1
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+class _Search:
+    def __init__(self, max_health, deadline, max_draws):
+        self.max_health = max_health
+        self.deadline = deadline
+        self.max_draws = max_draws
+        self.memo = {}
+        self.random = random.Random(0)
+        self.nodes = 0
+        self.layer = 0
+        self.estimated = False
+
+    def estimate(self, cards, health, weapon, limit):
+        """Guess the final score of a position the search did not reach.
+
+        Every potion left heals, and every monster left hits as hard as it
+        would against the best weapon still to come (or the current one,
+        within its limit).
+        """
+        self.estimated = True
+        best = max([code - WEAPON for code in cards if WEAPON < code < POTION], default=0)
+        health += WEAPON_WORTH * min(weapon, limit)
+        for code in cards:
+            if code > POTION:
+                health += POTION_WORTH * (code - POTION)
+            elif code < WEAPON:
+                blocked = max(best, weapon if code <= limit else 0)
+                if code > blocked:
+                    health -= code - blocked
+        return health
+
+    def value(self, state, depth):
+        """Expected final score from the start of (or part way through) a room"""
+        self.nodes += 1
+        if not self.nodes & 15 and time.perf_counter() > self.deadline:
+            raise _OutOfTime
+        unknown, bottom, room, health, weapon, limit, bonus, avoided, chosen, used = state
+        if avoided or chosen:
+            state = (unknown, bottom, tuple(sorted(room))) + state[3:]
+        key = (state, depth)
+        if key in self.memo:
+            return self.memo[key]
+
+        best = None
+        death, outcomes = play_room(tuple(sorted(room)), health, weapon, limit,
+                                    bonus, chosen, used, self.max_health)
+        if death is not None:
+            best = death_score(unknown, bottom, death[1])
+        for _, left, h, w, lim, bon in outcomes:
+            value = self.next_room(unknown, bottom, left, h, w, lim, bon, False, depth)
+            if best is None or value > best:
+                best = value
+        if not avoided and not chosen and (unknown or bottom):
+            # Avoiding plays no room, so it does not use up a level
+            value = self.next_room(unknown, bottom + room, (), health, weapon,
+                                   limit, bonus, True, depth + 1)
+            if value > best:
+                best = value
+        self.memo[key] = best
+        return best
+
+    def next_room(self, unknown, bottom, left, health, weapon, limit, bonus, avoided, depth):
+        """Expected final score once the room is refilled around left"""
+        if not unknown and not bottom and not left:
+            return final_score(health, bonus, self.max_health)
+        if depth <= 1:
+            return self.estimate(unknown + bottom + left, health, weapon, limit)
+        count = 4 - len(left)
+        # Draws further from the root matter less, so they get fewer samples
+        samples = max(MIN_DRAWS, self.max_draws >> 2 * self.layer)
+        if comb(len(unknown), min(count, len(unknown))) > samples:
+            # Too many to visit in time: average over a random sample
+            outcomes = sample_draws(unknown, bottom, count, self.random, samples)
+        else:
+            outcomes = draws(unknown, bottom, count)
+        total = 0
+        self.layer += 1
+        for probability, drawn, new_unknown, new_bottom in outcomes:
+            total += probability * self.value(
+                (new_unknown, new_bottom, left + drawn, health, weapon, limit,
+                 bonus, avoided, 0, False), depth - 1)
+        self.layer -= 1
+        return total
+
+    def rank(self, state, depth):
+        """Expected final score of each legal action, searching depth rooms ahead"""
+        unknown, bottom, room, health, weapon, limit, bonus, avoided, chosen, used = state
+        self.layer = 0
+        values = {}
+        for index, code in enumerate(room):
+            h, w, lim, bon, potion = play_card(code, health, weapon, limit, bonus,
+                                               used, self.max_health)
+            rest = room[:index] + room[index + 1:]
+            if h <= 0:
+                refill = 5 - len(room) if chosen == 2 else 0
+                values[index] = death_score(unknown, bottom, refill)
+            elif chosen == 2 or not rest:
+                values[index] = self.next_room(unknown, bottom, rest, h, w, lim, bon,
+                                               False, depth)
+            else:
+                values[index] = self.value((unknown, bottom, rest, h, w, lim, bon,
+                                            avoided, chosen + 1, potion), depth)
+        if not avoided and not chosen and (unknown or bottom):
+            values[AVOID_ROOM] = self.next_room(unknown, bottom + room, (), health, weapon,
+                                                limit, bonus, True, depth + 1)
+        return values
+
+
+def rank_actions(state, max_health, budget_ms=DEFAULT_BUDGET_MS, max_draws=MAX_DRAWS):
+    """Rank the legal actions of a belief state by expected final score.
+
+    Returns (ranking, depth): a list of (action, expected score) pairs, best
+    first, and the number of rooms the deepest finished pass looked ahead.
+    Lines that go past that depth are scored with a rough estimate. The
+    first pass always finishes; deeper ones stop once budget_ms is up.
+    """
+    deadline = time.perf_counter() + budget_ms / 1000
+    search = _Search(max_health, float("inf"), max_draws)
+    values = search.rank(state, 1)
+    search.deadline = deadline
+    depth = 1
+    while search.estimated:
+        search.estimated = False
+        try:
+            values = search.rank(state, depth + 1)
+        except _OutOfTime:
+            break
+        depth += 1
+    ranking = sorted(values.items(), key=lambda item: item[1], reverse=True)
+    return ranking, depth
+
+
+def hint(game, budget_ms=DEFAULT_BUDGET_MS):
+    """Rank the legal actions of a live game. See rank_actions."""
+    if game.is_over():
+        return [], 0
+    return rank_actions(belief_state(game), game.player.max_health, budget_ms)
@@ -0,0 +1,293 @@
+"""Top scores of finished games.
+
+Every finished game goes on three boards: "global", "day:YYYY-MM-DD" for the
+UTC day it ended and, for challenge games, "challenge:<id>". A board keeps
+its best `capacity` entries in a SkipList ordered by score and then by
+finishing order, so inserting, trimming and finding a game's rank are all
+O(log n) and never look at the other games.
+
+Finished games are appended to a log of fixed-size RECORDs and replayed on
+startup. Once the log holds many records that no board keeps any more, it is
+rewritten with just the kept ones.
+"""
+import os
+import random
+import struct
+import uuid
+from datetime import date, datetime, timezone
+
+# game id, score, day it ended (proleptic ordinal), challenge id
+RECORD = struct.Struct("<16shI24s")
+DEFAULT_CAPACITY = 1000
+# Rewrite the log when it is this many times longer than what is kept
+COMPACT_RATIO = 4
+_MAX_LEVEL = 32
+
+
+class _Node:
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key, value, level):
+        self.key = key
+        self.value = value
+        self.next = [None] * level
+        # width[i]: how many positions next[i] is ahead of this node
+        self.width = [1] * level
+
+
+class SkipList:
+    """Unique, sorted keys with O(log n) insert, remove, rank and indexing"""
+
+    def __init__(self, seed=0):
+        self.head = _Node(None, None, _MAX_LEVEL)
+        self.size = 0
+        # Seeded so the same inserts build the same list
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self.size
+
+    def _path(self, key):
+        """The last node before key on every level, and their positions"""
+        path = [None] * _MAX_LEVEL
+        positions = [0] * _MAX_LEVEL
+        node = self.head
+        position = 0
+        for level in range(_MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+            path[level] = node
+            positions[level] = position
+        return path, positions
+
+    def insert(self, key, value=None):
+        path, positions = self._path(key)
+        level = 1
+        while level < _MAX_LEVEL and self._random.random() < 0.5:
+            level += 1
+        node = _Node(key, value, level)
+        # The new node's position; everything after it moves up one
+        position = positions[0] + 1
+        for i in range(level):
+            before = path[i]
+            distance = position - positions[i]
+            node.next[i] = before.next[i]
+            node.width[i] = before.width[i] - distance + 1
+            before.next[i] = node
+            before.width[i] = distance
+        for i in range(level, _MAX_LEVEL):
+            path[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        """Remove key and return its value. Raises KeyError if it is missing."""
+        path, _ = self._path(key)
+        node = path[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for i in range(_MAX_LEVEL):
+            before = path[i]
+            if before.next[i] is node:
+                before.width[i] += node.width[i] - 1
+                before.next[i] = node.next[i]
+            else:
+                before.width[i] -= 1
+        self.size -= 1
+        return node.value
+
+    def rank(self, key):
+        """0-based position of key, or None if it is missing"""
+        path, positions = self._path(key)
+        node = path[0].next[0]
+        if node is None or node.key != key:
+            return None
+        return positions[0]
+
+    def count_below(self, key):
+        """How many keys are less than key"""
+        return self._path(key)[1][0]
+
+    def __getitem__(self, index):
+        """(key, value) at a 0-based position"""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        node = self.head
+        remaining = index + 1
+        for level in range(_MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        return node.key, node.value
+
+    def items(self, start=0, stop=None):
+        """(key, value) pairs from position start to stop"""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return []
+        node = self.head
+        remaining = start + 1
+        for level in range(_MAX_LEVEL - 1, -1, -1):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        items = []
+        for _ in range(stop - start):
+            items.append((node.key, node.value))
+            node = node.next[0]
+        return items
+
+
+class Board:
+    """The best `capacity` scores, earlier finishers first among ties"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.scores = SkipList()
+        self.keys = {}  # game id -> key in scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def add(self, game_id, score, order):
+        """Insert a game. Returns the id of the game that fell off the
+        board (possibly this one), or None."""
+        key = (-score, order)
+        if len(self.scores) >= self.capacity and key > self.scores[-1][0]:
+            return game_id
+        self.scores.insert(key, game_id)
+        self.keys[game_id] = key
+        if len(self.scores) > self.capacity:
+            dropped = self.scores.remove(self.scores[-1][0])
+            del self.keys[dropped]
+            return dropped
+        return None
+
+    def rank(self, game_id):
+        """(1-based rank, score) of a game, or None if it is not on the board"""
+        key = self.keys.get(game_id)
+        if key is None:
+            return None
+        return self.scores.rank(key) + 1, -key[0]
+
+    def above(self, score):
+        """How many games scored more than score"""
+        return self.scores.count_below((-score, -1))
+
+    def top(self, limit):
+        return [(-key[0], game_id) for key, game_id in self.scores.items(0, limit)]
+
+
+class Leaderboard:
+    """All boards, kept in sync with a log file (or only in memory if path is None)"""
+
+    def __init__(self, path=None, capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self.boards = {}
+        # Games on at least one board: id -> (order, score, day, challenge, boards)
+        self.kept = {}
+        self.order = 0
+        self.log = None
+        if path is not None:
+            if os.path.exists(path):
+                with open(path, "rb") as log:
+                    data = log.read()
+                # A torn last record from a crash is dropped
+                usable = len(data) - len(data) % RECORD.size
+                for offset in range(0, usable, RECORD.size):
+                    self._add(*_unpack(data[offset:offset + RECORD.size]))
+                if usable != len(data):
+                    self._compact()
+            self.log = open(path, "ab")
+
+    def record(self, game, day=None):
+        """Put a finished game on its boards"""
+        day = day or datetime.now(timezone.utc).date()
+        score = game.calculate_score()
+        challenge = game.challenge or ""
+        if self.log is not None:
+            self.log.write(RECORD.pack(uuid.UUID(game.id).bytes, score, day.toordinal(),
+                                       challenge.encode()))
+            self.log.flush()
+        self._add(game.id, score, day, challenge)
+        if self.log is not None and self.order > COMPACT_RATIO * max(len(self.kept), self.capacity):
+            self._compact()
+
+    def _add(self, game_id, score, day, challenge):
+        if game_id in self.kept:
+            # Logs merged by router.py may repeat a game
+            return
+        order = self.order
+        self.order += 1
+        names = ["global", f"day:{day.isoformat()}"]
+        if challenge:
+            names.append(f"challenge:{challenge}")
+        kept = []
+        for name in names:
+            board = self.boards.get(name)
+            if board is None:
+                board = self.boards[name] = Board(self.capacity)
+            dropped = board.add(game_id, score, order)
+            if dropped != game_id:
+                kept.append(name)
+            if dropped is not None and dropped != game_id:
+                self._release(dropped, name)
+        if kept:
+            self.kept[game_id] = (order, score, day, challenge, kept)
+
+    def _release(self, game_id, name):
+        entry = self.kept[game_id]
+        entry[4].remove(name)
+        if not entry[4]:
+            del self.kept[game_id]
+
+    def _compact(self):
+        """Rewrite the log with only the games still on a board"""
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as log:
+            for game_id, (_, score, day, challenge, _) in sorted(
+                    self.kept.items(), key=lambda item: item[1][0]):
+                log.write(RECORD.pack(uuid.UUID(game_id).bytes, score, day.toordinal(),
+                                      challenge.encode()))
+            log.flush()
+            os.fsync(log.fileno())
+        if self.log is not None:
+            self.log.close()
+        os.replace(temporary, self.path)
+        self.log = open(self.path, "ab")
+        # Replaying the rewritten log gives the same boards
+        self.order = 0
+        self.boards = {}
+        kept, self.kept = self.kept, {}
+        for game_id, (_, score, day, challenge, _) in sorted(
+                kept.items(), key=lambda item: item[1][0]):
+            self._add(game_id, score, day, challenge)
+
+    def top(self, name="global", limit=10):
+        """[(score, game id)] best first; empty for an unknown board"""
+        board = self.boards.get(name)
+        return board.top(limit) if board is not None else []
+
+    def rank(self, game_id, name="global"):
+        """(1-based rank, score) of a game on a board, or None"""
+        board = self.boards.get(name)
+        return board.rank(game_id) if board is not None else None
+
+    def above(self, score, name="global"):
+        """How many games on a board scored more than score"""
+        board = self.boards.get(name)
+        return board.above(score) if board is not None else 0
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def _unpack(data):
+    raw_id, score, day, challenge = RECORD.unpack(data)
+    return (str(uuid.UUID(bytes=raw_id)), score, date.fromordinal(day),
+            challenge.rstrip(b"\0").decode())
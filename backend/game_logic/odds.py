@@ -0,0 +1,153 @@
+"""Exact odds of clearing the dungeon with the best play.
+
+The odds are worked out by dynamic programming over belief states (see
+belief.py): the unseen cards are a multiset of card codes, so cards that
+differ only by suit are one and the same, and each refill is a chance node
+over the multisets that could be drawn. A player may see the order of a
+room before deciding to avoid it, and that order decides where the cards
+go at the bottom, so for avoidable rooms every order of the freshly drawn
+cards is weighed separately.
+
+The number of belief states grows too fast for this to answer early in a
+game: with more than MAX_UNSEEN cards unseen no search is tried at all, and
+even below that a search can run out of nodes. In practice the odds are
+known only for roughly the last dozen cards of the dungeon; before that
+they are None.
+
+Results are kept in a module level cache shared by every call, which also
+keeps the work done by a call that ran out of nodes.
+"""
+from itertools import permutations
+from .belief import belief_state, draws
+from .solver import NO_LIMIT, POTION, WEAPON, play_room
+
+# Positions a single call may work out before giving up, about a second
+MAX_NODES = 100000
+# Searches with more unseen cards than this do not finish within MAX_NODES
+MAX_UNSEEN = 9
+# The cache is dropped once it holds this many positions
+CACHE_SIZE = 1 << 20
+
+_cache = {}
+
+
+class _OutOfNodes(Exception):
+    pass
+
+
+def _hopeless(cards, health, weapon, limit):
+    """Whether the monsters in cards must kill us, even if every potion heals
+    in full and every monster meets the best weapon that is left"""
+    best = 0
+    for code in cards:
+        if code > POTION:
+            health += code - POTION
+        elif code > WEAPON and code - WEAPON > best:
+            best = code - WEAPON
+    for code in cards:
+        if code < WEAPON:
+            blocked = max(best, weapon if code <= limit else 0)
+            if code > blocked:
+                health -= code - blocked
+    return health <= 0
+
+
+class _Odds:
+    def __init__(self, max_health, max_nodes):
+        self.max_health = max_health
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+    def value(self, unknown, bottom, head, drawn, tail, health, weapon, limit,
+              avoided, chosen, used):
+        """Chance of winning from a room laid out as head, then the cards in
+        drawn in any order, then tail"""
+        avoidable = not avoided and not chosen and (unknown or bottom)
+        cards = tuple(sorted(head + drawn + tail))
+        if not weapon:
+            limit = NO_LIMIT
+        if avoidable:
+            key = (self.max_health, unknown, bottom, head, drawn, tail,
+                   health, weapon, limit, avoided, chosen, used)
+        else:
+            key = (self.max_health, unknown, bottom, cards, health, weapon, limit,
+                   avoided, chosen, used)
+        odds = _cache.get(key)
+        if odds is not None:
+            return odds
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise _OutOfNodes
+
+        if _hopeless(unknown + bottom + cards, health, weapon, limit):
+            odds = 0.0
+        else:
+            odds = self.play(unknown, bottom, head, drawn, tail, cards, health,
+                             weapon, limit, avoidable, chosen, used)
+        if len(_cache) >= CACHE_SIZE:
+            _cache.clear()
+        _cache[key] = odds
+        return odds
+
+    def play(self, unknown, bottom, head, drawn, tail, cards, health, weapon, limit,
+             avoidable, chosen, used):
+        """Chance of winning by playing the room, or avoiding it if allowed"""
+        # Bonus potions only change the score, not whether we win
+        _, outcomes = play_room(cards, health, weapon, limit, 0, chosen, used, self.max_health)
+        play = 0.0
+        for _, left, h, w, lim, _ in outcomes:
+            play = max(play, self.next_room(unknown, bottom, left, h, w, lim))
+            if play == 1:
+                return play
+        if not avoidable:
+            return play
+
+        # Avoid only when the room's order makes that the better choice
+        orders = set(permutations(drawn))
+        total = 0.0
+        for order in orders:
+            room = head + order + tail
+            total += max(play, self.next_room(unknown, bottom + room, (), health,
+                                              weapon, limit, True))
+        return total / len(orders)
+
+    def next_room(self, unknown, bottom, left, health, weapon, limit, avoided=False):
+        """Chance of winning once the room is refilled around left"""
+        if not unknown and not bottom and not left:
+            return 1.0
+        count = 4 - len(left)
+        taken = min(count, len(unknown))
+        total = 0.0
+        for probability, drawn, new_unknown, new_bottom in draws(unknown, bottom, count):
+            total += probability * self.value(
+                new_unknown, new_bottom, left, drawn[:taken], drawn[taken:],
+                health, weapon, limit, avoided, 0, False)
+        return total
+
+
+def state_win_probability(state, max_health, max_nodes=MAX_NODES):
+    """Chance of clearing the dungeon from a belief state (see belief.py)
+    with the best play.
+
+    Returns None when more than MAX_UNSEEN cards are unseen, or if the
+    search takes more than max_nodes new positions. Takes up to about a
+    second, so a server should run it in a worker process.
+    """
+    unknown, bottom, room, health, weapon, limit, _, avoided, chosen, used = state
+    if health <= 0:
+        return 0.0
+    if not unknown and not bottom and not room:
+        return 1.0
+    if len(unknown) > MAX_UNSEEN:
+        return None
+    try:
+        return _Odds(max_health, max_nodes).value(
+            unknown, bottom, room, (), (), health, weapon, limit, avoided, chosen, used)
+    except _OutOfNodes:
+        return None
+
+
+def win_probability(game, max_nodes=MAX_NODES):
+    """Chance of clearing the dungeon from here with the best play, or None.
+    See state_win_probability."""
+    return state_win_probability(belief_state(game), game.player.max_health, max_nodes)
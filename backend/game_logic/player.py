@@ -15,26 +15,26 @@ class Player:
         
     def use_potion(self, potion):
         if not self.used_potion_this_turn:
-            self.health = min(self.max_health, self.health + potion.get_value())
+            self.health = min(self.max_health, self.health + potion.true_value)
             self.used_potion_this_turn = True
             return True
         return False
             
     def fight_monster(self, monster):
-        monster_value = monster.get_value()
+        monster_value = monster.true_value
         
         if not self.equipped_weapon:
             # Fighting barehanded
             return monster_value
             
         # Check if weapon can be used against this monster
-        if self.slain_monsters and monster_value > self.slain_monsters[-1].get_value():
+        if self.slain_monsters and monster_value > self.slain_monsters[-1].true_value:
             # Monster is stronger than last monster slain with this weapon
             return monster_value
             
         # Use weapon
         self.slain_monsters.append(monster)
-        damage = max(0, monster_value - self.equipped_weapon.get_value())
+        damage = max(0, monster_value - self.equipped_weapon.true_value)
         return damage
         
     def is_alive(self):
@@ -0,0 +1,184 @@
+"""Play a policy over a range of seeds on every core.
+
+    python -m game_logic.simulate --policy greedy --start 0 --count 100000000 \\
+        --output results.jsonl
+
+The seed range is cut into chunks. Each worker process gets only a chunk's
+bounds, plays the whole chunk on a BatchGame, and sends back its arrays.
+Results are written as chunks finish, so the file is in chunk order only
+when a single worker is used.
+
+Output formats, one record per game:
+
+* jsonl: {"seed": ..., "score": ..., "death_room": ..., "actions": [...]}
+  where death_room is null if the player survived.
+* binary: RECORD structs (seed, score, death room or 0, number of actions,
+  then the actions padded to MAX_ACTIONS bytes).
+
+A checkpoint file beside the output records which chunks are written and
+how long the output was at that point. Running the same command again with
+--resume truncates the output to that length and plays only the missing
+chunks, so a killed run loses at most the chunks since its last checkpoint.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from .batch import MAX_ACTIONS, POLICIES, BatchGame
+
+RECORD = struct.Struct(f"<QhhB{MAX_ACTIONS}s")
+_RECORD_DTYPE = np.dtype([("seed", "<u8"), ("score", "<i2"), ("death_room", "<i2"),
+                          ("count", "u1"), ("actions", "i1", MAX_ACTIONS)])
+FORMATS = ("jsonl", "binary")
+DEFAULT_CHUNK = 10000
+CHECKPOINT_SECONDS = 10
+
+
+def play_chunk(policy, start, stop):
+    """Play seeds start..stop-1. Returns (scores, death rooms, action counts, actions)."""
+    batch = BatchGame(np.arange(start, stop, dtype=np.uint64))
+    scores = batch.run(POLICIES[policy])
+    return scores, batch.death_room, batch.action_count, batch.actions
+
+
+def encode_chunk(start, results, output_format):
+    """The output bytes for a chunk played by play_chunk"""
+    scores, death_rooms, action_counts, actions = results
+    if output_format == "binary":
+        records = np.empty(len(scores), dtype=_RECORD_DTYPE)
+        records["seed"] = np.arange(start, start + len(scores))
+        records["score"] = scores
+        records["death_room"] = death_rooms
+        records["count"] = action_counts
+        records["actions"] = actions
+        return records.tobytes()
+    lines = []
+    for i in range(len(scores)):
+        lines.append(json.dumps({
+            "seed": start + i,
+            "score": int(scores[i]),
+            "death_room": int(death_rooms[i]) or None,
+            "actions": actions[i, :action_counts[i]].tolist(),
+        }))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def read_binary(path):
+    """Yield (seed, score, death_room, actions) from a binary results file"""
+    with open(path, "rb") as results:
+        while True:
+            data = results.read(RECORD.size)
+            if len(data) < RECORD.size:
+                return
+            seed, score, death_room, count, actions = RECORD.unpack(data)
+            yield seed, score, death_room, list(actions[:count])
+
+
+def _load_checkpoint(path, settings):
+    with open(path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    for key, value in settings.items():
+        if checkpoint[key] != value:
+            raise ValueError(f"Checkpoint was made with {key}={checkpoint[key]!r}, not {value!r}")
+    return checkpoint["offset"], set(checkpoint["done"])
+
+
+def _save_checkpoint(path, settings, offset, done):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as checkpoint_file:
+        json.dump(dict(settings, offset=offset, done=sorted(done)), checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary, path)
+
+
+def simulate(policy, start, count, output, output_format="jsonl", chunk=DEFAULT_CHUNK,
+             workers=None, checkpoint=None, resume=False, checkpoint_seconds=CHECKPOINT_SECONDS):
+    """Play count games from seed start and write them to output.
+
+    Returns (games, wins, total score) for the chunks played by this call.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy: {policy}")
+    if output_format not in FORMATS:
+        raise ValueError(f"Unknown format: {output_format}")
+    checkpoint = checkpoint or output + ".checkpoint"
+    settings = {"policy": policy, "start": start, "count": count,
+                "format": output_format, "chunk": chunk}
+    chunks = [(start + offset, start + min(offset + chunk, count))
+              for offset in range(0, count, chunk)]
+
+    offset, done = 0, set()
+    if resume and os.path.exists(checkpoint):
+        offset, done = _load_checkpoint(checkpoint, settings)
+    results = open(output, "r+b" if resume and os.path.exists(output) else "wb")
+    results.truncate(offset)
+    results.seek(offset)
+
+    games = wins = total = 0
+    workers = workers or os.cpu_count() or 1
+    pending = deque(index for index in range(len(chunks)) if index not in done)
+    last_checkpoint = time.monotonic()
+    with results, ProcessPoolExecutor(workers) as pool:
+        running = {}
+        while pending or running:
+            # Keep a couple of chunks per worker queued, not the whole range
+            while pending and len(running) < 2 * workers:
+                index = pending.popleft()
+                running[pool.submit(play_chunk, policy, *chunks[index])] = index
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                played = future.result()
+                results.write(encode_chunk(chunks[index][0], played, output_format))
+                done.add(index)
+                scores = played[0]
+                games += len(scores)
+                wins += int((scores > 0).sum())
+                total += int(scores.sum())
+            if time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                results.flush()
+                os.fsync(results.fileno())
+                _save_checkpoint(checkpoint, settings, results.tell(), done)
+                last_checkpoint = time.monotonic()
+        results.flush()
+        os.fsync(results.fileno())
+        _save_checkpoint(checkpoint, settings, results.tell(), done)
+    return games, wins, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m game_logic.simulate",
+                                     description="Play a policy over a range of seeds.")
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--start", type=int, default=0, help="first seed")
+    parser.add_argument("--count", type=int, required=True, help="number of games")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="seeds per task")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    parser.add_argument("--checkpoint", help="default: OUTPUT.checkpoint")
+    parser.add_argument("--checkpoint-seconds", type=float, default=CHECKPOINT_SECONDS)
+    parser.add_argument("--resume", action="store_true",
+                        help="continue a run from its checkpoint")
+    args = parser.parse_args(argv)
+
+    began = time.perf_counter()
+    games, wins, total = simulate(
+        args.policy, args.start, args.count, args.output, args.format, args.chunk,
+        args.workers, args.checkpoint, args.resume, args.checkpoint_seconds)
+    elapsed = time.perf_counter() - began
+    if games:
+        print(f"{games} games in {elapsed:.1f}s ({games / elapsed:.0f}/s): "
+              f"{wins / games:.2%} won, mean score {total / games:.2f}", file=sys.stderr)
+    else:
+        print("Nothing left to play", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
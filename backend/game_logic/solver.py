@@ -0,0 +1,393 @@
+"""Exact solver for a game whose deck order is known.
+
+The search works a room at a time on a compact copy of the game: cards are
+reduced to codes (suits only matter for their type), and a room is expanded
+by playing every order of picks at once. Positions are memoized, and a
+position is skipped when an already searched one with the same cards is at
+least as good in every respect (health, weapon, weapon limit and pending
+potion bonus) and could not reach the score we are looking for.
+"""
+from functools import lru_cache
+from .game import AVOID_ROOM
+
+# Card codes: monsters are their value, weapons WEAPON + value and
+# potions POTION + value
+WEAPON = 20
+POTION = 40
+# Weapon limit when the weapon has not slain anything yet
+NO_LIMIT = 15
+
+
+def card_code(card):
+    if card.type == "weapon":
+        return WEAPON + card.true_value
+    if card.type == "potion":
+        return POTION + card.true_value
+    return card.true_value
+
+
+def play_card(code, health, weapon, limit, bonus, used, max_health):
+    """Play one card. Returns the new (health, weapon, limit, bonus, used)."""
+    if code < WEAPON:
+        if weapon and code <= limit:
+            if code > weapon:
+                health -= code - weapon
+            limit = code
+        else:
+            health -= code
+            bonus = 0
+    elif code < POTION:
+        if weapon:
+            bonus = 0
+        weapon = code - WEAPON
+        limit = NO_LIMIT
+    elif not used:
+        # A second potion in the same room is thrown away unused
+        health = min(max_health, health + code - POTION)
+        used = True
+        bonus = code - POTION
+    return health, weapon, limit, bonus, used
+
+
+@lru_cache(maxsize=1 << 16)
+def play_room(room, health, weapon, limit, bonus, chosen, used, max_health):
+    """Every distinct way to make this room's remaining picks.
+
+    Returns (death, outcomes). death is None or (picked, refill) for the
+    line that dies with the most cards drawn into the next room, and
+    outcomes are (picked, left, health, weapon, limit, bonus) for lines
+    that live, leaving out any that another line with the same left over
+    card beats on every count. room must be sorted. Results are cached, as
+    the deck plays no part.
+    """
+    picks = 3 - chosen
+    death = None
+    groups = {}
+    seen = set()
+    stack = [((), room, health, weapon, limit, bonus, used)]
+    while stack:
+        picked, cards, h, w, lim, bon, potion = stack.pop()
+        if len(picked) == picks or not cards:
+            groups.setdefault(cards, []).append((h, w, lim, bon, picked))
+            continue
+        for i, code in enumerate(cards):
+            if i and code == cards[i - 1]:
+                continue
+            nh, nw, nlim, nbon, npotion = play_card(code, h, w, lim, bon, potion, max_health)
+            if nh <= 0:
+                # Dying on the room's last pick still draws the next room,
+                # which takes those cards out of the death score
+                refill = 5 - len(cards) if len(picked) + 1 == picks else 0
+                if death is None or refill > death[1]:
+                    death = (picked + (code,), refill)
+                continue
+            rest = cards[:i] + cards[i + 1:]
+            seen_key = (rest, nh, nw, nlim, nbon, npotion)
+            if seen_key not in seen:
+                seen.add(seen_key)
+                stack.append((picked + (code,), rest, nh, nw, nlim, nbon, npotion))
+
+    outcomes = []
+    for left, group in groups.items():
+        # Drop outcomes that another one beats on every count
+        group.sort(reverse=True)
+        kept = []
+        for h, w, lim, bon, picked in group:
+            for other in kept:
+                if other[0] >= h and other[1] >= w and other[2] >= lim and other[3] >= bon:
+                    break
+            else:
+                kept.append((h, w, lim, bon))
+                outcomes.append((picked, left, h, w, lim, bon))
+    outcomes.sort(key=lambda outcome: outcome[2], reverse=True)
+    return death, tuple(outcomes)
+
+
+class _Solver:
+    def __init__(self, game):
+        self.max_health = game.player.max_health
+        self.dealt = dealt = tuple(card_code(card) for card in game.deck.dealt)
+        self.memo = {}
+        self.nodes = 0
+
+        # Totals over dealt[pos:] for every pos, so bounds only have to look
+        # at the cards in the room and at the bottom
+        size = len(dealt) + 1
+        self.potion_sum = [0] * size
+        self.potion_max = [0] * size
+        self.weapon_max = [0] * size
+        # below[pos][w][limit]: damage the monsters up to limit take past a
+        # weapon of value w (w = 0 for bare hands)
+        self.below = [None] * size
+        self.below[len(dealt)] = [[0] * (NO_LIMIT + 1) for _ in range(11)]
+        for pos in range(len(dealt) - 1, -1, -1):
+            code = dealt[pos]
+            self.potion_sum[pos] = self.potion_sum[pos + 1]
+            self.potion_max[pos] = self.potion_max[pos + 1]
+            self.weapon_max[pos] = self.weapon_max[pos + 1]
+            self.below[pos] = self.below[pos + 1]
+            if code > POTION:
+                self.potion_sum[pos] += code - POTION
+                self.potion_max[pos] = max(self.potion_max[pos], code - POTION)
+            elif code > WEAPON:
+                self.weapon_max[pos] = max(self.weapon_max[pos], code - WEAPON)
+            else:
+                self.below[pos] = [
+                    [damage + code - w if w < code <= limit else damage
+                     for limit, damage in enumerate(row)]
+                    for w, row in enumerate(self.below[pos])]
+        self.bottoms = {}
+
+    def bottom_totals(self, bottom):
+        """(potion sum, best potion, best weapon, monsters) of the cards at
+        the bottom, worked out once per bottom"""
+        totals = self.bottoms.get(bottom)
+        if totals is None:
+            potions = best_potion = best_weapon = 0
+            monsters = []
+            for code in bottom:
+                if code > POTION:
+                    potions += code - POTION
+                    best_potion = max(best_potion, code - POTION)
+                elif code > WEAPON:
+                    best_weapon = max(best_weapon, code - WEAPON)
+                else:
+                    monsters.append(code)
+            totals = self.bottoms[bottom] = (potions, best_potion, best_weapon, monsters)
+        return totals
+
+    def upper_bound(self, state):
+        """Best score reachable if potions always heal in full and every
+        monster meets the best weapon that could be in hand for it: the
+        current one up to its limit, or any weapon still to come"""
+        pos, bottom, room, health, weapon, limit, bonus, avoided, chosen, used = state
+        potions, best_potion, fresh, monsters = self.bottom_totals(bottom)
+        potions += self.potion_sum[pos]
+        best_potion = max(best_potion, self.potion_max[pos])
+        fresh = max(fresh, self.weapon_max[pos])
+        potion_ahead = best_potion
+        room_potion = False
+        room_weapon = 0
+        room_monsters = []
+        for code in room:
+            if code > POTION:
+                potions += code - POTION
+                if code - POTION > best_potion:
+                    best_potion = code - POTION
+                room_potion = True
+            elif code > WEAPON:
+                if code - WEAPON > room_weapon:
+                    room_weapon = code - WEAPON
+            else:
+                room_monsters.append(code)
+        # Any potion still to be drunk replaces the pending bonus; only a
+        # second potion in this room can be thrown away instead
+        if not potion_ahead and (used or not room_potion):
+            best_potion = max(best_potion, bonus)
+
+        if room_weapon > fresh:
+            fresh = room_weapon
+        armed = max(fresh, weapon)
+        below = self.below[pos]
+        damage = below[armed][limit] + below[fresh][NO_LIMIT] - below[fresh][limit]
+        for monster in monsters:
+            if monster <= limit:
+                if monster > armed:
+                    damage += monster - armed
+            elif monster > fresh:
+                damage += monster - fresh
+        later = []
+        for monster in room_monsters:
+            least = monster - (armed if monster <= limit else fresh)
+            later.append(least if least > 0 else 0)
+        damage += sum(later)
+        if (avoided or chosen) and room_monsters:
+            # The room cannot be avoided, so all but the card left over are
+            # fought now, with the current weapon or one from this room
+            left = max(0, len(room) - 3 + chosen)
+            extra = []
+            for monster, least in zip(room_monsters, later):
+                now = monster - room_weapon
+                if weapon and monster <= limit:
+                    now = min(now, monster - weapon)
+                extra.append(max(0, now) - least)
+            extra.sort()
+            damage += sum(extra[:max(0, len(extra) - left)])
+
+        health += potions - damage
+        if health <= 0:
+            return 0  # a death score
+        if health < self.max_health:
+            return health
+        return self.max_health + best_potion
+
+    def expand(self, state):
+        """All distinct ways to finish the current room.
+
+        Returns (order, value, child) triples: order is the card codes picked
+        (or None to avoid the room), value the final score if the game ends,
+        otherwise child is the state at the start of the next room.
+        """
+        pos, bottom, room, health, weapon, limit, bonus, avoided, chosen, used = state
+        dealt = self.dealt
+        deck_size = len(dealt) - pos + len(bottom)
+        children = []
+        death, outcomes = play_room(tuple(sorted(room)), health, weapon, limit,
+                                    bonus, chosen, used, self.max_health)
+
+        for picked, left, h, w, lim, bon in outcomes:
+            if not left and not deck_size:
+                score = h + bon if h == self.max_health and bon else h
+                children.append((picked, score, None))
+                continue
+            draw = dealt[pos:pos + 4 - len(left)]
+            new_pos = pos + len(draw)
+            new_bottom = bottom
+            if len(draw) < 4 - len(left):
+                extra = 4 - len(left) - len(draw)
+                draw += bottom[:extra]
+                new_bottom = bottom[extra:]
+            children.append((picked, None, (new_pos, new_bottom, left + draw,
+                                            h, w, lim, bon, False, 0, False)))
+
+        if not avoided and not chosen and deck_size:
+            new_bottom = bottom + room
+            draw = dealt[pos:pos + 4]
+            new_pos = pos + len(draw)
+            if len(draw) < 4:
+                extra = 4 - len(draw)
+                draw += new_bottom[:extra]
+                new_bottom = new_bottom[extra:]
+            children.append((None, None, (new_pos, new_bottom, draw,
+                                          health, weapon, limit, bonus, True, 0, False)))
+
+        if death is not None:
+            picked, refill = death
+            deck = dealt[pos + refill:] + bottom[max(0, refill - len(dealt) + pos):]
+            children.append((picked, -sum(code for code in deck if code < WEAPON), None))
+        return children
+
+    def search(self, state, alpha):
+        """Best final score from state. Values <= alpha are only upper bounds."""
+        self.nodes += 1
+        pos, bottom, room, health, weapon, limit, bonus, avoided, chosen, used = state
+        # Room order only matters if the room can still be avoided
+        if avoided or chosen:
+            room = tuple(sorted(room))
+        key = (pos, bottom, room, avoided, chosen, used)
+        entries = self.memo.get(key)
+        if entries:
+            for h, w, lim, bon, value, exact in entries:
+                if h >= health and w >= weapon and lim >= limit and bon >= bonus:
+                    if value <= alpha:
+                        return value
+                    if exact and h == health and w == weapon and lim == limit and bon == bonus:
+                        return value
+
+        bound = self.upper_bound(state)
+        if bound <= alpha:
+            return bound
+
+        best = None
+        for _, value, child in self.expand(state):
+            if child is not None:
+                value = self.search(child, alpha if best is None or best < alpha else best)
+            if best is None or value > best:
+                best = value
+                if best >= bound:
+                    break
+
+        self.memo.setdefault(key, []).append(
+            (health, weapon, limit, bonus, best, best > alpha))
+        return best
+
+    def solve(self, state):
+        # Ask "can we reach at least target?" from the bound downwards. Each
+        # failed test proves a lower upper bound, and high targets prune well.
+        target = self.upper_bound(state)
+        while True:
+            value = self.search(state, target - 1)
+            if value >= target:
+                return value
+            target = value
+
+
+def _state_of(game):
+    deck = game.deck
+    player = game.player
+    bottom = deck.bottom[max(0, deck.head - len(deck.dealt)):]
+    limit = player.slain_monsters[-1].true_value if player.slain_monsters else NO_LIMIT
+    top = game.discard_pile[-1] if game.discard_pile else None
+    return (
+        min(deck.head, len(deck.dealt)),
+        tuple(card_code(card) for card in bottom),
+        tuple(card_code(card) for card in game.current_room),
+        player.health,
+        player.equipped_weapon.true_value if player.equipped_weapon else 0,
+        limit,
+        top.true_value if top is not None and top.type == "potion" else 0,
+        game.avoided_previous_room,
+        game.cards_chosen_this_room,
+        player.used_potion_this_turn,
+    )
+
+
+def solve(game):
+    """Find the best possible play for a game with a known deck order.
+
+    Returns (score, actions): the highest score Game.calculate_score can end
+    on, and a list of actions that reaches it when passed to Game.apply one
+    by one. The game itself is left unchanged.
+
+    A full deal takes about a third of a second in the median (seeds 0-39),
+    but about one deal in four takes 1-5 seconds. Endgames with a dozen
+    cards left take milliseconds. Run it offline or in a worker process, as
+    seed_index does, not while serving a request.
+    """
+    if game.is_over():
+        return game.calculate_score(), []
+    solver = _Solver(game)
+    state = _state_of(game)
+    score = solver.solve(state)
+
+    # Follow a line that keeps the score, turning card codes into room indices
+    actions = []
+    tokens = []
+    while not game.is_over():
+        for order, value, child in solver.expand(state):
+            if child is not None:
+                value = solver.search(child, score - 1)
+            if value >= score:
+                break
+        else:
+            raise RuntimeError("Solver lost track of the best line")
+        if order is None:
+            actions.append(AVOID_ROOM)
+            tokens.append(game.apply(AVOID_ROOM))
+        for code in order or ():
+            index = [card_code(card) for card in game.current_room].index(code)
+            actions.append(index)
+            tokens.append(game.apply(index))
+        state = child
+
+    final = game.calculate_score()
+    for token in reversed(tokens):
+        game.undo(token)
+    if final != score:
+        raise RuntimeError(f"Solver line scored {final}, expected {score}")
+    return score, actions
+
+
+def solve_value(game):
+    """The highest score solve() would find, without the line that reaches
+    it. Returns (score, positions searched)."""
+    if game.is_over():
+        return game.calculate_score(), 0
+    solver = _Solver(game)
+    return solver.solve(_state_of(game)), solver.nodes
+
+
+def is_winnable(game):
+    """Whether some line of play clears the dungeon alive"""
+    score, _ = solve_value(game)
+    return score > 0
@@ -0,0 +1,240 @@
+"""Game logs in a SQLite database.
+
+Recently used games stay in memory as GameLogs, most recent last. record()
+only updates that cache and marks the game dirty; a background thread
+writes dirty games every flush_interval seconds (or sooner once
+flush_batch of them pile up) in a single transaction. The database runs in
+WAL mode with synchronous=NORMAL, so a commit appends to the log without
+waiting for an fsync, and a request never waits for the disk to write.
+
+The cache holds at most cache_size games. Only games already written are
+dropped from it; a game that is not cached is read back on its next load.
+Games recorded since the last flush are lost if the process dies.
+"""
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+from .event_store import SNAPSHOT_INTERVAL, GameLog
+from .store import GameStore
+
+FLUSH_INTERVAL = 0.5
+FLUSH_BATCH = 1000
+CACHE_SIZE = 100000
+
+_SNAPSHOT_HEADER = struct.Struct("<BBB")
+_SEED_OFFSET = 1 << 63  # seeds are unsigned 64-bit, SQLite integers signed
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id TEXT PRIMARY KEY,
+    seed INTEGER NOT NULL,
+    challenge TEXT,
+    created REAL,
+    actions BLOB NOT NULL,
+    snapshot BLOB
+);
+CREATE INDEX IF NOT EXISTS games_created ON games (created);
+"""
+
+
+def _encode_snapshot(snapshot):
+    if snapshot is None:
+        return None
+    count, packed, room_number, rooms_avoided = snapshot
+    return _SNAPSHOT_HEADER.pack(count, room_number, rooms_avoided) + packed
+
+
+def _decode_snapshot(data):
+    if data is None:
+        return None
+    count, room_number, rooms_avoided = _SNAPSHOT_HEADER.unpack_from(data)
+    return count, bytes(data[_SNAPSHOT_HEADER.size:]), room_number, rooms_avoided
+
+
+class SQLiteStore(GameStore):
+    def __init__(self, path, cache_size=CACHE_SIZE, flush_interval=FLUSH_INTERVAL,
+                 flush_batch=FLUSH_BATCH, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.snapshot_interval = snapshot_interval
+        self.cache = OrderedDict()  # game id -> GameLog
+        self.dirty = set()
+        self.deleted = set()
+        # Games in the transaction being written, kept in the cache until it commits
+        self.writing = set()
+        # Guards the cache, the sets and the read connection
+        self.lock = threading.Lock()
+        self.connection = self._connect(path)
+        self.connection.executescript(_SCHEMA)
+        # Flushes write on their own connection, outside the lock
+        self._writer = self._connect(path)
+        self._write_lock = threading.Lock()
+
+        self._wake = threading.Event()
+        self._closing = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-store-flush",
+                                         daemon=True)
+        self._flusher.start()
+
+    @staticmethod
+    def _connect(path):
+        connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _get(self, game_id):
+        """The cached log for an id, read from the database if needed, or None"""
+        log = self.cache.get(game_id)
+        if log is not None:
+            self.cache.move_to_end(game_id)
+            return log
+        if game_id in self.deleted:
+            return None
+        row = self.connection.execute(
+            "SELECT seed, challenge, created, actions, snapshot FROM games WHERE id = ?",
+            (game_id,)).fetchone()
+        if row is None:
+            return None
+        seed, challenge, created, actions, snapshot = row
+        log = GameLog(seed + _SEED_OFFSET, challenge, created)
+        log.actions = bytearray(actions)
+        log.snapshot = _decode_snapshot(snapshot)
+        self._cache(game_id, log)
+        return log
+
+    def _cache(self, game_id, log):
+        self.cache[game_id] = log
+        if len(self.cache) > self.cache_size:
+            # Drop the least recently used games that are safely on disk
+            for old_id in list(self.cache):
+                if len(self.cache) <= self.cache_size:
+                    break
+                if old_id != game_id and old_id not in self.dirty and old_id not in self.writing:
+                    del self.cache[old_id]
+
+    def __contains__(self, game_id):
+        with self.lock:
+            return self._get(game_id) is not None
+
+    def add(self, game):
+        log = GameLog.of(game)
+        log.record(game, self.snapshot_interval)
+        with self.lock:
+            self.deleted.discard(game.id)
+            self._cache(game.id, log)
+            self._mark(game.id)
+
+    def record(self, game):
+        with self.lock:
+            log = self._get(game.id)
+            if log is None:
+                raise KeyError(game.id)
+            if log.record(game, self.snapshot_interval):
+                self._mark(game.id)
+
+    def load(self, game_id):
+        with self.lock:
+            log = self._get(game_id)
+        if log is None:
+            raise KeyError(game_id)
+        return log.game(game_id)
+
+    def version(self, game_id):
+        with self.lock:
+            log = self._get(game_id)
+            if log is None:
+                raise KeyError(game_id)
+            return len(log.actions)
+
+    def delete(self, game_id):
+        with self.lock:
+            if self._get(game_id) is None:
+                raise KeyError(game_id)
+            del self.cache[game_id]
+            self.dirty.discard(game_id)
+            self.deleted.add(game_id)
+            self._wake.set()
+
+    def created_times(self):
+        with self.lock:
+            times = dict(self.connection.execute("SELECT id, created FROM games"))
+            for game_id in self.deleted:
+                times.pop(game_id, None)
+            times.update((game_id, log.created) for game_id, log in self.cache.items())
+        return list(times.items())
+
+    def _mark(self, game_id):
+        self.dirty.add(game_id)
+        if len(self.dirty) >= self.flush_batch:
+            self._wake.set()
+
+    def flush(self):
+        """Write every dirty game in one transaction"""
+        with self._write_lock:
+            with self.lock:
+                rows = []
+                for game_id in self.dirty:
+                    log = self.cache[game_id]
+                    rows.append((game_id, log.seed - _SEED_OFFSET, log.challenge, log.created,
+                                 bytes(log.actions), _encode_snapshot(log.snapshot)))
+                deleted = [(game_id,) for game_id in self.deleted]
+                if not rows and not deleted:
+                    return
+                self.writing = set(self.dirty)
+                self.dirty.clear()
+            writer = self._writer
+            try:
+                writer.execute("BEGIN")
+                try:
+                    writer.executemany(
+                        "INSERT OR REPLACE INTO games "
+                        "(id, seed, challenge, created, actions, snapshot) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    writer.executemany("DELETE FROM games WHERE id = ?", deleted)
+                    writer.execute("COMMIT")
+                except BaseException:
+                    writer.execute("ROLLBACK")
+                    raise
+            except BaseException:
+                with self.lock:
+                    self.dirty |= {game_id for game_id in self.writing if game_id in self.cache}
+                    self.writing = set()
+                raise
+            with self.lock:
+                self.writing = set()
+                # Deleted ids can be read from the database again once gone from it
+                self.deleted.difference_update(game_id for game_id, in deleted)
+
+    def purge(self, before):
+        """Delete the games created before a time (as in Game.created)"""
+        with self._write_lock:
+            with self.lock:
+                for game_id in [game_id for game_id, log in self.cache.items()
+                                if log.created is not None and log.created < before]:
+                    del self.cache[game_id]
+                    self.dirty.discard(game_id)
+            self._writer.execute("DELETE FROM games WHERE created < ?", (before,))
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # The games stay dirty and are tried again on the next round
+                pass
+
+    def close(self):
+        if self._closing:
+            return
+        self._closing = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        with self.lock:
+            self.connection.close()
+            self._writer.close()
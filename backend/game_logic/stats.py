@@ -0,0 +1,242 @@
+"""Play statistics over finished games in constant memory.
+
+GameStats is fed every action and every finished game, and keeps only
+fixed-size summaries: integer histograms, quantile sketches for game length
+and action latency, and a count-min sketch of card events. Nothing grows
+with the number of games, so summary() costs the same after a billion
+games as after one.
+
+Every summary merges by adding counts, so GameStats objects built in
+different processes combine with merge(). state() and from_state() turn one
+into plain JSON types and back for sending it between processes.
+"""
+import hashlib
+import math
+import numpy as np
+from .card import CARDS
+
+# Card events counted per card
+CARD_EVENTS = ("picked", "avoided", "slain", "fatal")
+
+
+class Histogram:
+    """Counts of integers from low to high; values outside are clamped"""
+
+    def __init__(self, low, high):
+        self.low = low
+        self.counts = np.zeros(high - low + 1, dtype=np.int64)
+
+    def add(self, value, count=1):
+        self.counts[min(max(value - self.low, 0), len(self.counts) - 1)] += count
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def mean(self):
+        total = self.total()
+        if not total:
+            return None
+        values = np.arange(self.low, self.low + len(self.counts))
+        return float((values * self.counts).sum() / total)
+
+    def to_dict(self):
+        """{value: count} for the values seen"""
+        return {int(self.low + i): int(self.counts[i]) for i in np.flatnonzero(self.counts)}
+
+
+class QuantileSketch:
+    """Quantiles of positive values to within a relative error.
+
+    Values go in logarithmic buckets (as in DDSketch), so any quantile is
+    off by at most `accuracy` times its value. Past max_buckets the lowest
+    buckets are folded together, which only loses accuracy at the bottom.
+    """
+
+    def __init__(self, accuracy=0.01, max_buckets=2048):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value, count=1):
+        self.count += count
+        if value <= 0:
+            self.zeros += count
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        indices = sorted(self.buckets)
+        folded = indices[:len(indices) - self.max_buckets + 1]
+        total = sum(self.buckets.pop(index) for index in folded)
+        top = folded[-1]
+        self.buckets[top] = self.buckets.get(top, 0) + total
+
+    def merge(self, other):
+        self.count += other.count
+        self.zeros += other.zeros
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q):
+        """The q-quantile (0 <= q <= 1), or None if nothing was added"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class CountMin:
+    """Approximate counts of string keys: never under, and over by at most
+    about e/width of the total with probability 1 - exp(-depth)"""
+
+    def __init__(self, width=1024, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        self._rows = np.arange(depth)
+
+    def _columns(self, key):
+        # A stable hash, so sketches from different processes line up
+        digest = hashlib.blake2b(key.encode(), digest_size=4 * self.depth).digest()
+        return np.frombuffer(digest, dtype="<u4") % self.width
+
+    def add(self, key, count=1):
+        self.table[self._rows, self._columns(key)] += count
+
+    def estimate(self, key):
+        return int(self.table[self._rows, self._columns(key)].min())
+
+    def merge(self, other):
+        self.table += other.table
+
+
+class GameStats:
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.scores = Histogram(-210, 30)
+        self.death_rooms = Histogram(0, 30)  # 0 for games survived
+        self.avoided_rooms = Histogram(0, 15)
+        self.weapons = Histogram(2, 10)  # value of every weapon equipped
+        self.weapon_kills = 0
+        self.barehanded_kills = 0
+        self.lengths = QuantileSketch()  # actions per game
+        self.latencies = QuantileSketch()  # seconds per action
+        self.cards = CountMin()
+
+    def record_action(self, card, weapon_used, avoided_cards, killed, seconds):
+        """One action: the card picked (None for avoiding the room), whether
+        a weapon took on a monster, the cards sent to the bottom, whether the
+        pick killed the player, and how long the action took"""
+        self.latencies.add(seconds)
+        for avoided in avoided_cards:
+            self.cards.add(f"avoided:{avoided.id}")
+        if card is None:
+            return
+        self.cards.add(f"picked:{card.id}")
+        if card.type == "weapon":
+            self.weapons.add(card.true_value)
+        elif card.type == "monster":
+            if weapon_used:
+                self.weapon_kills += 1
+                self.cards.add(f"slain:{card.id}")
+            else:
+                self.barehanded_kills += 1
+            if killed:
+                self.cards.add(f"fatal:{card.id}")
+
+    def record_game(self, game, death_room):
+        """A finished game and the room it was lost in, 0 if it was won"""
+        score = game.calculate_score()
+        # Every pick removes a card from play
+        actions = len(CARDS) - game.deck.cards_remaining() - len(game.current_room) + game.rooms_avoided
+        self.games += 1
+        self.wins += score > 0
+        self.scores.add(score)
+        self.death_rooms.add(death_room)
+        self.avoided_rooms.add(game.rooms_avoided)
+        self.lengths.add(actions)
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins += other.wins
+        for name in ("scores", "death_rooms", "avoided_rooms", "weapons",
+                     "lengths", "latencies", "cards"):
+            getattr(self, name).merge(getattr(other, name))
+        self.weapon_kills += other.weapon_kills
+        self.barehanded_kills += other.barehanded_kills
+
+    def state(self):
+        """Everything as JSON types, for from_state in another process"""
+        return {
+            "games": self.games,
+            "wins": self.wins,
+            "histograms": {name: getattr(self, name).counts.tolist()
+                           for name in ("scores", "death_rooms", "avoided_rooms", "weapons")},
+            "weapon_kills": self.weapon_kills,
+            "barehanded_kills": self.barehanded_kills,
+            "sketches": {name: [getattr(self, name).zeros, getattr(self, name).count,
+                                list(getattr(self, name).buckets.items())]
+                         for name in ("lengths", "latencies")},
+            "cards": self.cards.table.tolist(),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.games = state["games"]
+        stats.wins = state["wins"]
+        for name, counts in state["histograms"].items():
+            getattr(stats, name).counts[:] = counts
+        stats.weapon_kills = state["weapon_kills"]
+        stats.barehanded_kills = state["barehanded_kills"]
+        for name, (zeros, count, buckets) in state["sketches"].items():
+            sketch = getattr(stats, name)
+            sketch.zeros, sketch.count = zeros, count
+            sketch.buckets = {index: bucket_count for index, bucket_count in buckets}
+        stats.cards.table[:] = state["cards"]
+        return stats
+
+    def summary(self, top_cards=5):
+        """Aggregates for GET /stats"""
+        quantiles = (0.5, 0.9, 0.99)
+        cards = {}
+        for event in CARD_EVENTS:
+            counts = sorted(((self.cards.estimate(f"{event}:{card.id}"), card.id) for card in CARDS),
+                            reverse=True)
+            cards[event] = [{"card": CARDS[card_id].to_dict(), "count": count}
+                            for count, card_id in counts[:top_cards] if count]
+        latency = {f"p{round(q * 100)}": self.latencies.quantile(q) for q in quantiles}
+        return {
+            "games": self.games,
+            "win_rate": self.wins / self.games if self.games else None,
+            "mean_score": self.scores.mean(),
+            "scores": self.scores.to_dict(),
+            "death_rooms": {room: count for room, count in self.death_rooms.to_dict().items() if room},
+            "avoided_rooms": self.avoided_rooms.to_dict(),
+            "weapons_equipped": self.weapons.to_dict(),
+            "monsters_slain": {"weapon": self.weapon_kills, "barehanded": self.barehanded_kills},
+            "game_length": {f"p{round(q * 100)}": self.lengths.quantile(q) for q in quantiles},
+            "latency_ms": {name: value * 1000 if value is not None else None
+                           for name, value in latency.items()},
+            "cards": cards,
+        }
@@ -0,0 +1,47 @@
+"""Where the server keeps its games.
+
+A GameStore hands out Game objects by id and takes back the actions played
+on them. Implementations:
+
+* event_store.EventStore: seed and action logs in memory (the default).
+* sqlite_store.SQLiteStore: the same logs in a SQLite database, with recent
+  games cached in memory and writes batched in the background.
+* expiry.ExpiringStore: wraps either to expire idle and old games, moving
+  them to a spill store if given one.
+"""
+from abc import ABC, abstractmethod
+
+
+class GameStore(ABC):
+    @abstractmethod
+    def add(self, game):
+        """Start storing a new game"""
+
+    @abstractmethod
+    def load(self, game_id):
+        """A Game for the id. Raises KeyError for an unknown id."""
+
+    @abstractmethod
+    def record(self, game):
+        """Save the actions played on a game since it was loaded. Raises
+        ValueError if the stored game was played on since then."""
+
+    def version(self, game_id):
+        """Game.version of a game, without rebuilding it where the store can
+        avoid that. Raises KeyError for an unknown id."""
+        return self.load(game_id).version
+
+    @abstractmethod
+    def delete(self, game_id):
+        """Stop storing a game. Raises KeyError for an unknown id."""
+
+    @abstractmethod
+    def created_times(self):
+        """(game id, Game.created) for every stored game"""
+
+    @abstractmethod
+    def __contains__(self, game_id):
+        """Whether a game with the id is stored"""
+
+    def close(self):
+        """Write out anything pending and release resources"""
@@ -0,0 +1,87 @@
+"""Fixed-size transposition table for searches over Game positions."""
+
+# What a stored value means
+EXACT = 0
+LOWER_BOUND = 1  # the true value is at least this
+UPPER_BOUND = 2  # the true value is at most this
+
+# Replacement policies
+ALWAYS_REPLACE = "always"
+DEPTH_PREFERRED = "depth"
+
+
+class TranspositionTable:
+    """Maps position hashes (Game.hash) to search results.
+
+    The table has a fixed number of slots and a position can only live in
+    the slot picked by its hash, so memory never grows. When two positions
+    want the same slot the policy decides who keeps it:
+
+    * ALWAYS_REPLACE: the newest entry wins.
+    * DEPTH_PREFERRED: an entry is only replaced by a search at least as
+      deep, unless it was stored before the last new_search() call.
+    """
+
+    def __init__(self, size=1 << 20, policy=DEPTH_PREFERRED):
+        if size <= 0 or size & (size - 1):
+            raise ValueError("Table size must be a power of two")
+        if policy not in (ALWAYS_REPLACE, DEPTH_PREFERRED):
+            raise ValueError(f"Unknown replacement policy: {policy}")
+        self.size = size
+        self.policy = policy
+        self._mask = size - 1
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        size = self.size
+        self._keys = [None] * size
+        self._depths = [0] * size
+        self._values = [0] * size
+        self._flags = [EXACT] * size
+        self._moves = [None] * size
+        self._generations = [0] * size
+        self.filled = 0
+        self.hits = 0
+        self.misses = 0
+        self.replacements = 0
+
+    def new_search(self):
+        """Let entries from earlier searches be replaced regardless of depth"""
+        self.generation += 1
+
+    def probe(self, key):
+        """Return (depth, value, flag, move) stored for key, or None"""
+        slot = key & self._mask
+        if self._keys[slot] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._depths[slot], self._values[slot], self._flags[slot], self._moves[slot]
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        """Record a search result for key. Returns False if the policy kept the old entry."""
+        slot = key & self._mask
+        stored = self._keys[slot]
+        if stored is None:
+            self.filled += 1
+        elif stored != key:
+            if (self.policy == DEPTH_PREFERRED and
+                    self._generations[slot] == self.generation and
+                    self._depths[slot] > depth):
+                return False
+            self.replacements += 1
+        self._keys[slot] = key
+        self._depths[slot] = depth
+        self._values[slot] = value
+        self._flags[slot] = flag
+        self._moves[slot] = move
+        self._generations[slot] = self.generation
+        return True
+
+    def __len__(self):
+        return self.filled
+
+    def __contains__(self, key):
+        return self._keys[key & self._mask] == key
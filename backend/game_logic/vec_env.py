@@ -0,0 +1,232 @@
+"""Vectorized Scoundrel environments for reinforcement learning.
+
+ScoundrelVecEnv steps a batch of games per call in the style of a gym
+VecEnv: step(actions) returns observations, rewards, done flags and a mask
+of legal actions, as arrays with one row per environment. Finished games are
+restarted right away from the next seed of their environment, so the
+observation returned for a done environment is the first one of its new game.
+
+The returned arrays are buffers owned by the environment and are overwritten
+by the next call; copy them to keep them.
+
+ShardedVecEnv splits the environments over worker processes that share those
+buffers, and steps exactly like a ScoundrelVecEnv with the same arguments.
+"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from .batch import BatchGame
+from .card import CARDS
+
+# Observation layout, one int16 row per environment
+OBS_HEALTH = 0
+OBS_WEAPON = 1  # weapon value, 0 for none
+OBS_LAST_SLAIN = 2  # last monster the weapon slew, 0 for none
+OBS_BONUS = 3  # potion on top of the discard pile
+OBS_CHOSEN = 4  # cards taken from this room
+OBS_USED_POTION = 5
+OBS_AVOIDED = 6  # the previous room was avoided
+OBS_DECK_SIZE = 7
+OBS_ROOM = 8  # 4 card ids, -1 for an empty slot
+OBS_IN_DECK = 12  # per card id: 1 while it is in the deck
+OBS_SIZE = OBS_IN_DECK + len(CARDS)
+
+NUM_ACTIONS = 5  # room indices 0-3 and AVOID_ROOM
+
+
+class ScoundrelVecEnv:
+    """num_envs games played in lockstep.
+
+    Environment i plays seeds seed + i, seed + i + num_envs, and so on. A
+    shard of a larger set of environments passes its first_env and
+    total_envs to keep the seeds of the whole set.
+
+    The reward is the change in Game.calculate_score: health while the game
+    goes on, then the final score, so the rewards of an episode add up to
+    its final score minus max_health.
+    """
+
+    def __init__(self, num_envs, seed=0, first_env=0, total_envs=None, max_health=20):
+        self.num_envs = num_envs
+        self.total_envs = total_envs or num_envs
+        self.env_ids = np.arange(first_env, first_env + num_envs, dtype=np.int64)
+        self.seed = seed
+        self.episodes = np.zeros(num_envs, dtype=np.int64)
+        self.batch = BatchGame(self._seeds(np.arange(num_envs)), max_health)
+
+        self.observations = np.zeros((num_envs, OBS_SIZE), dtype=np.int16)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+        self.legal = np.zeros((num_envs, NUM_ACTIONS), dtype=bool)
+        # Final score of each environment's last finished game
+        self.episode_scores = np.zeros(num_envs, dtype=np.int16)
+        self._last_scores = np.zeros(num_envs, dtype=np.int16)
+        self._observe()
+
+    def _seeds(self, rows):
+        return (self.seed + self.env_ids[rows] +
+                self.episodes[rows] * self.total_envs).astype(np.uint64)
+
+    def reset(self, seed=None):
+        """Restart every environment from its first seed. Returns (observations, legal)."""
+        if seed is not None:
+            self.seed = seed
+        self.episodes[:] = 0
+        self.batch.reset(self.batch.rows, self._seeds(self.batch.rows))
+        self.dones[:] = False
+        self.rewards[:] = 0
+        self._observe()
+        return self.observations, self.legal
+
+    def step(self, actions):
+        """Play one action per environment.
+
+        Returns (observations, rewards, dones, legal). Raises ValueError if an
+        action is not legal; the legal mask of the last call says which are.
+        """
+        batch = self.batch
+        batch.step(actions)
+        np.copyto(self.dones, batch.over)
+        np.subtract(batch.health, self._last_scores, out=self.rewards)
+        done = np.flatnonzero(self.dones)
+        if len(done):
+            scores = batch.scores(done)
+            self.rewards[done] = scores - self._last_scores[done]
+            self.episode_scores[done] = scores
+            self.episodes[done] += 1
+            batch.reset(done, self._seeds(done))
+        self._observe()
+        return self.observations, self.rewards, self.dones, self.legal
+
+    def _observe(self):
+        batch = self.batch
+        obs = self.observations
+        obs[:, OBS_HEALTH] = batch.health
+        obs[:, OBS_WEAPON] = batch.weapon
+        obs[:, OBS_LAST_SLAIN] = batch.last_slain
+        obs[:, OBS_BONUS] = batch.bonus
+        obs[:, OBS_CHOSEN] = batch.chosen
+        obs[:, OBS_USED_POTION] = batch.used_potion
+        obs[:, OBS_AVOIDED] = batch.avoided
+        np.subtract(batch.deck_end, batch.head, out=obs[:, OBS_DECK_SIZE])
+        obs[:, OBS_ROOM:OBS_IN_DECK] = batch.room
+        obs[:, OBS_IN_DECK:] = 0
+        rows, positions = np.nonzero(batch.in_deck())
+        obs[rows, OBS_IN_DECK + batch.deck[rows, positions]] = 1
+        np.copyto(self._last_scores, batch.health)
+        np.copyto(self.legal, batch.legal_mask())
+
+
+# Buffers shared between ShardedVecEnv and its workers: name, dtype, row shape
+_SHARED = (
+    ("actions", np.int64, ()),
+    ("observations", np.int16, (OBS_SIZE,)),
+    ("rewards", np.float32, ()),
+    ("dones", bool, ()),
+    ("legal", bool, (NUM_ACTIONS,)),
+    ("episode_scores", np.int16, ()),
+)
+
+
+def _attach(blocks, num_envs):
+    return {name: np.ndarray((num_envs,) + shape, dtype=dtype, buffer=blocks[name].buf)
+            for name, dtype, shape in _SHARED}
+
+
+def _worker(pipe, names, start, stop, num_envs, seed, max_health):
+    blocks = {name: shared_memory.SharedMemory(name=names[name]) for name in names}
+    arrays = {name: array[start:stop] for name, array in _attach(blocks, num_envs).items()}
+    env = ScoundrelVecEnv(stop - start, seed, start, num_envs, max_health)
+    try:
+        while True:
+            command, argument = pipe.recv()
+            if command == "step":
+                env.step(arrays["actions"])
+            elif command == "reset":
+                env.reset(argument)
+            else:
+                break
+            for name in ("observations", "rewards", "dones", "legal", "episode_scores"):
+                np.copyto(arrays[name], getattr(env, name))
+            pipe.send(None)
+    except ValueError as error:
+        pipe.send(error)
+    finally:
+        arrays.clear()
+        for block in blocks.values():
+            block.close()
+
+
+class ShardedVecEnv:
+    """ScoundrelVecEnv spread over num_shards worker processes (one per
+    core by default). Use as a context manager or call close()."""
+
+    def __init__(self, num_envs, num_shards=None, seed=0, max_health=20):
+        num_shards = min(num_shards or os.cpu_count() or 1, num_envs)
+        self.num_envs = num_envs
+        self._blocks = {
+            name: shared_memory.SharedMemory(
+                create=True, size=max(1, num_envs * int(np.prod(shape, dtype=int)) *
+                                      np.dtype(dtype).itemsize))
+            for name, dtype, shape in _SHARED
+        }
+        arrays = _attach(self._blocks, num_envs)
+        for name, array in arrays.items():
+            setattr(self, name, array)
+        names = {name: block.name for name, block in self._blocks.items()}
+
+        bounds = np.linspace(0, num_envs, num_shards + 1).astype(int)
+        self._pipes = []
+        self._workers = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_worker, args=(child, names, start, stop, num_envs, seed, max_health),
+                daemon=True)
+            worker.start()
+            self._pipes.append(parent)
+            self._workers.append(worker)
+        self.reset(seed)
+
+    def _call(self, command, argument=None):
+        for pipe in self._pipes:
+            pipe.send((command, argument))
+        errors = [error for error in (pipe.recv() for pipe in self._pipes) if error is not None]
+        if errors:
+            self.close()
+            raise errors[0]
+
+    def reset(self, seed=None):
+        """See ScoundrelVecEnv.reset"""
+        self._call("reset", seed)
+        return self.observations, self.legal
+
+    def step(self, actions):
+        """See ScoundrelVecEnv.step. A ValueError closes the environment."""
+        self.actions[:] = actions
+        self._call("step")
+        return self.observations, self.rewards, self.dones, self.legal
+
+    def close(self):
+        if not self._workers:
+            return
+        for pipe, worker in zip(self._pipes, self._workers):
+            if worker.is_alive():
+                try:
+                    pipe.send(("close", None))
+                except OSError:
+                    pass
+            worker.join()
+        self._workers = []
+        for name, _, _ in _SHARED:
+            delattr(self, name)
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
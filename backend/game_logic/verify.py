@@ -0,0 +1,149 @@
+"""Check claimed scores by replaying games.
+
+    python -m game_logic.verify claims.jsonl > verdicts.jsonl
+
+A claim is {"seed": ..., "actions": [...], "score": ...}, the same shape as
+the jsonl written by game_logic.simulate. Claims are replayed in chunks on
+a BatchGame, one process per core, and each gets a verdict:
+
+    {"seed": ..., "valid": true, "score": 12, "reason": null}
+
+A claim is invalid if an action is not legal (including actions after the
+game ended), if the actions stop before the game is over, or if the score
+they reach is not the claimed one. Verdicts come out in the order of the
+claims, chunk by chunk, while later chunks are still being replayed.
+"""
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import numpy as np
+from .batch import EMPTY, MAX_ACTIONS, BatchGame
+from .game import AVOID_ROOM
+
+VALID = 0
+ILLEGAL = 1
+UNFINISHED = 2
+MISMATCH = 3
+TOO_LONG = 4
+DEFAULT_CHUNK = 4096
+
+
+def encode_claims(claims):
+    """Claims as the arrays verify_chunk takes: seeds, actions padded to
+    MAX_ACTIONS, action counts and claimed scores"""
+    n = len(claims)
+    seeds = np.zeros(n, dtype=np.uint64)
+    actions = np.full((n, MAX_ACTIONS), EMPTY, dtype=np.int8)
+    lengths = np.zeros(n, dtype=np.int16)
+    scores = np.zeros(n, dtype=np.int64)
+    for i, claim in enumerate(claims):
+        seeds[i] = claim["seed"]
+        played = claim["actions"]
+        # Longer lists are flagged by verify_chunk, so keep one action past the limit out
+        lengths[i] = min(len(played), MAX_ACTIONS + 1)
+        clipped = played[:MAX_ACTIONS]
+        actions[i, :len(clipped)] = np.clip(clipped, EMPTY, AVOID_ROOM + 1)
+        scores[i] = claim["score"]
+    return seeds, actions, lengths, scores
+
+
+def verify_chunk(seeds, actions, lengths, claimed):
+    """Replay a chunk of claims.
+
+    Returns (verdicts, positions, scores): VALID or the reason a claim
+    fails, the move an illegal action was at, and the score reached.
+    """
+    n = len(seeds)
+    batch = BatchGame(seeds)
+    rows = batch.rows
+    verdicts = np.where(lengths > MAX_ACTIONS, TOO_LONG, VALID).astype(np.int8)
+    positions = np.full(n, -1, dtype=np.int16)
+    batch.over |= verdicts != VALID
+    for move in range(MAX_ACTIONS + 1):
+        live = ~batch.over
+        if not live.any():
+            break
+        played = lengths > move
+        action = actions[:, move] if move < MAX_ACTIONS else np.zeros(n, dtype=np.int8)
+        legal = batch.legal_mask()[rows, np.clip(action, 0, AVOID_ROOM)] & \
+            (action >= 0) & (action <= AVOID_ROOM)
+        illegal = live & played & ~legal
+        verdicts[illegal] = ILLEGAL
+        positions[illegal] = move
+        verdicts[live & ~played] = UNFINISHED
+        # Rejected games stop here; the rest move on together
+        batch.over |= live & (illegal | ~played)
+        batch.step(np.where(played, action, 0))
+    # Actions left over after the game ended
+    extra = (verdicts == VALID) & (lengths > batch.action_count)
+    verdicts[extra] = ILLEGAL
+    positions[extra] = batch.action_count[extra]
+    scores = batch.scores()
+    verdicts[(verdicts == VALID) & (scores != claimed)] = MISMATCH
+    return verdicts, positions, scores
+
+
+def describe(seed, verdict, position, score, claimed):
+    """The verdict for one claim as a JSON-ready dict"""
+    reason = None
+    if verdict == ILLEGAL:
+        reason = f"illegal action at move {position}"
+    elif verdict == UNFINISHED:
+        reason = "the game is not over"
+    elif verdict == MISMATCH:
+        reason = f"actions score {score}, not {claimed}"
+    elif verdict == TOO_LONG:
+        reason = f"more than {MAX_ACTIONS} actions"
+    return {"seed": int(seed), "valid": bool(verdict == VALID),
+            "score": int(score) if verdict in (VALID, MISMATCH) else None, "reason": reason}
+
+
+def verify(claims, chunk=DEFAULT_CHUNK, workers=None):
+    """Yield a verdict per claim, in order, from an iterable of claims.
+
+    Claims are read a chunk at a time, with a couple of chunks per worker
+    in flight, so huge inputs stream through in bounded memory.
+    """
+    claims = iter(claims)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        running = deque()
+        while True:
+            while len(running) < 2 * workers:
+                part = list(islice(claims, chunk))
+                if not part:
+                    break
+                arrays = encode_claims(part)
+                running.append((arrays, pool.submit(verify_chunk, *arrays)))
+            if not running:
+                return
+            (seeds, _, _, claimed), future = running.popleft()
+            for row in zip(seeds, *future.result(), claimed):
+                yield describe(*row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m game_logic.verify",
+                                     description="Replay claimed scores and check them.")
+    parser.add_argument("claims", help="jsonl file of claims, - for stdin")
+    parser.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="claims per task")
+    parser.add_argument("--workers", type=int, default=None, help="default: one per core")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.claims == "-" else open(args.claims)
+    valid = total = 0
+    with source:
+        claims = (json.loads(line) for line in source if line.strip())
+        for verdict in verify(claims, args.chunk, args.workers):
+            print(json.dumps(verdict))
+            valid += verdict["valid"]
+            total += 1
+    print(f"{valid} of {total} claims valid", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Zobrist keys for hashing game positions.
+
+A position hash is the XOR of one key per feature: each card left in the
+deck (keyed by its position in the deck order), each card in the room, the
+player's health, the weapon, the top of the slain stack, the top of the
+discard pile and the room flags. Game keeps its hash up to date as it plays.
+"""
+import random
+from .card import CARDS
+
+# The deck order only grows when a room is avoided. Avoided rooms add at most
+# 4 cards and need 3 picks in between, so 44 cards never take up more than
+# 104 positions.
+MAX_DECK_POSITIONS = 128
+MAX_HEALTH = 64
+MAX_CHOSEN = 8
+
+_random = random.Random(0x5C0DE)
+
+
+def _keys(count):
+    return [_random.getrandbits(64) for _ in range(count)]
+
+
+DECK_KEYS = [_keys(len(CARDS)) for _ in range(MAX_DECK_POSITIONS)]
+ROOM_KEYS = _keys(len(CARDS))
+WEAPON_KEYS = _keys(len(CARDS))
+SLAIN_KEYS = _keys(len(CARDS))
+DISCARD_KEYS = _keys(len(CARDS))
+HEALTH_KEYS = _keys(MAX_HEALTH)
+CHOSEN_KEYS = _keys(MAX_CHOSEN)
+AVOIDED_KEY = _random.getrandbits(64)
+POTION_USED_KEY = _random.getrandbits(64)
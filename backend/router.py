@@ -0,0 +1,378 @@
+"""Serve the game from several processes.
+
+    python router.py --shards 4 --port 8000
+
+app.py keeps its live games in process memory, so running it as several
+uvicorn workers would send requests to processes that do not hold the game.
+Instead this starts `--shards` app.py servers, each on its own unix socket,
+and serves a thin router in front of them. Game ids are consistent-hashed
+onto the shards (game_logic.hash_ring): a shard only creates ids it owns,
+and the router forwards every request about a game to its owner.
+
+The shards share one SQLite database (SCOUNDREL_DATABASE, games.db by
+default). When the router is restarted with a different number of shards,
+the games whose owner changed are loaded from the database by their new
+owner; consistent hashing keeps that to about one game in `shards`. Each
+shard has its own leaderboard log and archive; the router merges the
+leaderboards, and the logs of shards that are gone are folded into the
+remaining ones on startup.
+"""
+import argparse
+import asyncio
+import glob
+import heapq
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+import httpx
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
+from starlette.background import BackgroundTask
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+from game_logic.batch_request import BatchRequest, check_limits
+from game_logic.hash_ring import HashRing
+from game_logic.leaderboard import RECORD
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SHARD_START_SECONDS = 30
+# Not passed on between the client, the router and a shard
+_HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "host",
+                "origin", "upgrade"}
+
+# Set by connect()
+ring = None
+sockets = []
+clients = []
+_next_shard = itertools.count()
+
+def connect(shard_sockets):
+    """Route to shard servers listening on these unix sockets"""
+    global ring, clients
+    ring = HashRing(len(shard_sockets))
+    sockets[:] = shard_sockets
+    clients = [httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket),
+                                 base_url="http://shard", timeout=None)
+               for socket in shard_sockets]
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    for client in clients:
+        await client.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def _any_shard():
+    return next(_next_shard) % len(clients)
+
+def _body_owner(body):
+    """The shard that owns the game_id in a JSON body. Bodies without one go
+    to shard 0, which rejects them the way a single server would."""
+    try:
+        game_id = json.loads(body).get("game_id")
+    except (ValueError, AttributeError):
+        return 0
+    return ring.owner(game_id) if isinstance(game_id, str) else 0
+
+async def forward(shard, request, body=None):
+    """Send a request on to a shard and stream its response back"""
+    if body is None:
+        body = await request.body()
+    headers = [(name, value) for name, value in request.headers.items()
+               if name not in _HOP_HEADERS]
+    url = request.url.path + ("?" + request.url.query if request.url.query else "")
+    client = clients[shard]
+    try:
+        upstream = await client.send(
+            client.build_request(request.method, url, headers=headers, content=body),
+            stream=True)
+    except httpx.TransportError:
+        raise HTTPException(status_code=502, detail=f"Shard {shard} is unavailable")
+    headers = {name: value for name, value in upstream.headers.items()
+               if name not in _HOP_HEADERS}
+    return StreamingResponse(upstream.aiter_raw(), status_code=upstream.status_code,
+                             headers=headers, background=BackgroundTask(upstream.aclose))
+
+async def _get_all(path, params, shards=None):
+    """GET path from every shard (or the given ones) at once"""
+    shards = range(len(clients)) if shards is None else shards
+    try:
+        return await asyncio.gather(*(clients[shard].get(path, params=params)
+                                      for shard in shards))
+    except httpx.TransportError:
+        raise HTTPException(status_code=502, detail="A shard is unavailable")
+
+def _passthrough(response):
+    return Response(response.content, status_code=response.status_code,
+                    media_type=response.headers.get("content-type"))
+
+def _failed_result(operation, error):
+    """A result shaped like the one app.py gives for this operation"""
+    if operation.op == "create":
+        return {"games": [], "error": error}
+    if operation.op == "play":
+        return {"game_id": operation.game_id, "played": 0, "state": None, "error": error}
+    return {"error": error}
+
+@app.post("/new-game")
+async def create_game(request: Request):
+    # The shard picks an id it owns, so any shard will do
+    return await forward(_any_shard(), request)
+
+@app.post("/action")
+@app.post("/hint")
+async def game_request(request: Request):
+    body = await request.body()
+    return await forward(_body_owner(body), request, body)
+
+@app.post("/batch")
+async def run_batch(request: Request):
+    # Each shard runs the operations on the games it owns, in their order,
+    # and the results are put back in the order they were asked for. The
+    # limits apply to the whole batch, so they are checked here. Operations
+    # sent to a shard that fails get an error result; that shard may or may
+    # not have run them.
+    body = await request.body()
+    try:
+        batch = BatchRequest.model_validate_json(body)
+    except ValidationError:
+        # The shard answers with the same error a single server would
+        return await forward(0, request, body)
+    try:
+        check_limits(batch)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    operations = batch.operations
+    parts = {}
+    for index, operation in enumerate(operations):
+        if operation.op == "play" and operation.game_id is not None:
+            shard = ring.owner(operation.game_id)
+        else:
+            shard = _any_shard()
+        parts.setdefault(shard, []).append(index)
+
+    async def run_part(shard):
+        """The shard's reply, or the error for each of its operations"""
+        try:
+            response = await clients[shard].post("/batch", json={
+                "operations": [operations[index].model_dump(exclude_unset=True) for index in parts[shard]],
+                "final_only": batch.final_only})
+        except httpx.TransportError:
+            return None, f"Shard {shard} is unavailable"
+        if response.status_code != 200:
+            return None, f"Shard {shard} failed with status {response.status_code}"
+        return response.json(), None
+
+    shards = list(parts)
+    replies = await asyncio.gather(*(run_part(shard) for shard in shards))
+
+    if batch.final_only:
+        states, errors = {}, []
+        for shard, (reply, failure) in zip(shards, replies):
+            if failure is not None:
+                errors.extend({"index": index, "error": failure} for index in parts[shard])
+                continue
+            states.update(reply["states"])
+            errors.extend(dict(error, index=parts[shard][error["index"]]) for error in reply["errors"])
+        return {"states": states, "errors": sorted(errors, key=lambda error: error["index"])}
+    results = [None] * len(operations)
+    for shard, (reply, failure) in zip(shards, replies):
+        if failure is not None:
+            for index in parts[shard]:
+                results[index] = _failed_result(operations[index], failure)
+            continue
+        for index, result in zip(parts[shard], reply["results"]):
+            results[index] = result
+    return {"results": results}
+
+@app.get("/state/{game_id}")
+async def get_game_state(game_id: str, request: Request):
+    return await forward(ring.owner(game_id), request)
+
+@app.websocket("/ws/{game_id}")
+async def game_socket(websocket: WebSocket, game_id: str):
+    # Relay frames both ways between the client and the owner's session
+    url = f"ws://shard{websocket.url.path}" + (f"?{websocket.url.query}" if websocket.url.query else "")
+    await websocket.accept()
+    try:
+        upstream = await unix_connect(sockets[ring.owner(game_id)], url)
+    except (OSError, InvalidHandshake):
+        await websocket.close(code=1011, reason="Shard unavailable")
+        return
+
+    async def to_client():
+        try:
+            async for frame in upstream:
+                if isinstance(frame, bytes):
+                    await websocket.send_bytes(frame)
+                else:
+                    await websocket.send_text(frame)
+        except ConnectionClosed:
+            pass
+        except (RuntimeError, WebSocketDisconnect):
+            # The client is gone
+            return
+        try:
+            await websocket.close(code=upstream.close_code or 1000, reason=upstream.close_reason or "")
+        except RuntimeError:
+            # The client closed first
+            pass
+
+    relay = asyncio.create_task(to_client())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            await upstream.send(message.get("text") or message.get("bytes") or "")
+    except ConnectionClosed:
+        pass
+    finally:
+        relay.cancel()
+        await upstream.close()
+
+@app.get("/leaderboard")
+async def get_leaderboard(request: Request):
+    responses = await _get_all("/leaderboard", request.query_params)
+    for response in responses:
+        if response.status_code != 200:
+            return _passthrough(response)
+    boards = [response.json() for response in responses]
+    # Each shard keeps its own top entries, so their union holds the overall top
+    limit = int(request.query_params.get("limit", 10))
+    merged = heapq.merge(*(board["entries"] for board in boards),
+                         key=lambda entry: -entry["score"])
+    entries = [dict(entry, rank=rank) for rank, entry in enumerate(itertools.islice(merged, limit), 1)]
+    return {"board": boards[0]["board"], "entries": entries}
+
+@app.get("/leaderboard/rank/{game_id}")
+async def get_leaderboard_rank(game_id: str, board: str = "global"):
+    # Finished games stay on the leaderboard of the shard they finished on,
+    # which is not their owner any more if the shard count changed since
+    responses = await _get_all(f"/leaderboard/rank/{game_id}", {"board": board})
+    holder = next((shard for shard, response in enumerate(responses)
+                   if response.status_code == 200), None)
+    if holder is None:
+        return _passthrough(responses[0])
+    entry = responses[holder].json()
+    others = [shard for shard in range(len(clients)) if shard != holder]
+    counts = await _get_all("/leaderboard/count", {"board": board, "above": entry["score"]},
+                            others)
+    entry["rank"] += sum(response.json()["count"] for response in counts)
+    return entry
+
+@app.get("/leaderboard/count")
+async def get_leaderboard_count(request: Request):
+    responses = await _get_all("/leaderboard/count", request.query_params)
+    for response in responses:
+        if response.status_code != 200:
+            return _passthrough(response)
+    counts = [response.json() for response in responses]
+    return dict(counts[0], count=sum(count["count"] for count in counts))
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def other_request(request: Request):
+    # Everything else (stats, verification) is the same on every shard
+    return await forward(_any_shard(), request)
+
+def fold_leaderboards(base, shards):
+    """Append the leaderboard logs of shards numbered shards or more onto
+    those of the remaining shards"""
+    for path in glob.glob(glob.escape(base) + ".*"):
+        suffix = path[len(base) + 1:]
+        if not suffix.isdigit() or int(suffix) < shards:
+            continue
+        with open(path, "rb") as log:
+            data = log.read()
+        with open(f"{base}.{int(suffix) % shards}", "ab") as log:
+            log.write(data[:len(data) - len(data) % RECORD.size])
+            log.flush()
+            os.fsync(log.fileno())
+        os.remove(path)
+
+def start_shards(shards, socket_dir):
+    """Start the shard servers. Returns their processes and sockets."""
+    leaderboard = os.environ.get("SCOUNDREL_LEADERBOARD", os.path.join(HERE, "leaderboard.log"))
+    archive = os.environ.get("SCOUNDREL_ARCHIVE", os.path.join(HERE, "games.archive"))
+    fold_leaderboards(leaderboard, shards)
+    shared = {
+        "SCOUNDREL_DATABASE": os.environ.get("SCOUNDREL_DATABASE", os.path.join(HERE, "games.db")),
+        "SCOUNDREL_STATS_DIR": os.environ.get("SCOUNDREL_STATS_DIR",
+                                              os.path.join(socket_dir, "stats")),
+    }
+    os.makedirs(shared["SCOUNDREL_STATS_DIR"], exist_ok=True)
+    processes, sockets = [], []
+    for shard in range(shards):
+        socket = os.path.join(socket_dir, f"shard-{shard}.sock")
+        if os.path.exists(socket):
+            os.remove(socket)
+        env = dict(os.environ, **shared,
+                   SCOUNDREL_SHARD=f"{shard}/{shards}",
+                   SCOUNDREL_LEADERBOARD=f"{leaderboard}.{shard}",
+                   SCOUNDREL_ARCHIVE=f"{archive}.{shard}")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--uds", socket, "--log-level", "warning"],
+            cwd=HERE, env=env))
+        sockets.append(socket)
+    deadline = time.monotonic() + SHARD_START_SECONDS
+    for process, socket in zip(processes, sockets):
+        while not _listening(socket):
+            if process.poll() is not None or time.monotonic() > deadline:
+                stop_shards(processes)
+                raise RuntimeError(f"Shard server on {socket} did not start")
+            time.sleep(0.05)
+    return processes, sockets
+
+def _listening(socket):
+    try:
+        with httpx.Client(transport=httpx.HTTPTransport(uds=socket)) as client:
+            client.get("http://shard/leaderboard/count", params={"above": 0})
+        return True
+    except httpx.TransportError:
+        return False
+
+def stop_shards(processes):
+    # Shards flush their stores and logs as they shut down
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.wait()
+
+def main(argv=None):
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serve Scoundrel from several shard processes.")
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket-dir", default=None,
+                        help="where the shards' unix sockets go (default: a temporary directory)")
+    args = parser.parse_args(argv)
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    socket_dir = args.socket_dir or tempfile.mkdtemp(prefix="scoundrel-")
+    processes, sockets = start_shards(args.shards, socket_dir)
+    try:
+        connect(sockets)
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        stop_shards(processes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""Point app.py at throwaway files before a test imports it, and share one
+client for it"""
+import os
+import tempfile
+import pytest
+from fastapi.testclient import TestClient
+
+_data = tempfile.mkdtemp(prefix="scoundrel-tests-")
+os.environ["SCOUNDREL_LEADERBOARD"] = os.path.join(_data, "leaderboard.log")
+os.environ["SCOUNDREL_ARCHIVE"] = os.path.join(_data, "games.archive")
+os.environ.pop("SCOUNDREL_DATABASE", None)
+os.environ.pop("SCOUNDREL_STATS_DIR", None)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """A client for app.py. Its shutdown closes the stores and the worker
+    pool, so every test shares one."""
+    import app
+    with TestClient(app.app) as client:
+        yield client
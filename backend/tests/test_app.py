@@ -0,0 +1,34 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+import app
+
+
+def test_game_gone_before_load(client, monkeypatch):
+    """A game that expires between being found and being loaded is a 404"""
+    def expired(game_id):
+        raise KeyError(game_id)
+    game_id = client.post("/new-game").json()["game_id"]
+    monkeypatch.setattr(app.games, "load", expired)
+    assert client.post("/action", json={
+        "game_id": game_id, "action_type": "select_card", "card_index": 0}).status_code == 404
+    assert client.post("/hint", json={"game_id": game_id}).status_code == 404
+    assert client.get(f"/state/{game_id}").status_code == 404
+    with client.websocket_connect(f"/ws/{game_id}") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 4404
+
+
+@pytest.mark.parametrize("claim", [
+    {"seed": 1, "actions": [0, 5], "score": 0},
+    {"seed": 1, "actions": [1 << 70], "score": 0},
+    {"seed": 1, "actions": [0], "score": 1 << 70},
+])
+def test_verify_rejects_unstorable_claims(client, claim):
+    assert client.post("/verify", json=[claim]).status_code == 422
+
+
+def test_verify_checks_a_claim(client):
+    response = client.post("/verify", json=[{"seed": 1, "actions": [0], "score": 0}])
+    assert response.status_code == 200
+    assert response.json()["reason"] == "the game is not over"
@@ -0,0 +1,42 @@
+import pytest
+import app
+from game_logic.event_store import GameLog
+from game_logic.game import AVOID_ROOM, Game
+
+
+def test_action_during_batch(client, monkeypatch):
+    """An /action that lands between two of a batch's plays on the same game
+    is kept, and the batch plays on after it"""
+    game = Game(1)
+    app.games.add(game)
+    new_game = app.new_game
+
+    def new_game_then_action(*args):
+        response = client.post("/action", json={
+            "game_id": game.id, "action_type": "select_card", "card_index": 1})
+        assert response.status_code == 200
+        return new_game(*args)
+    monkeypatch.setattr(app, "new_game", new_game_then_action)
+
+    results = client.post("/batch", json={"operations": [
+        {"op": "play", "game_id": game.id, "actions": [AVOID_ROOM]},
+        {"op": "create"},
+        {"op": "play", "game_id": game.id, "actions": [0, 0]}]}).json()["results"]
+
+    expected = Game.replay(1, [AVOID_ROOM, 1, 0, 0], game.id)
+    assert [result["error"] for result in results] == [None, None, None]
+    assert results[2]["played"] == 2
+    assert results[2]["state"] == expected.get_state()
+    assert app.games.load(game.id).get_state() == expected.get_state()
+
+
+def test_log_rejects_stale_game():
+    game = Game(1)
+    log = GameLog.of(game)
+    stale = Game(1)
+    game.apply(AVOID_ROOM)
+    assert log.record(game)
+    stale.apply(0)
+    with pytest.raises(ValueError):
+        log.record(stale)
+    assert list(log.actions) == [AVOID_ROOM]
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from game_logic.batch import BatchGame, first_card_policy, greedy_policy, random_policy
+from game_logic.game import Game
+
+SEEDS = range(200)
+
+
+def game_view(game):
+    """What a BatchGame row holds, read from a Game"""
+    player = game.player
+    weapon = player.equipped_weapon
+    return {
+        "health": player.health,
+        "weapon": weapon.true_value if weapon else 0,
+        "last_slain": player.slain_monsters[-1].true_value if player.slain_monsters else 0,
+        "room": [card.id for card in game.current_room],
+        "cards_remaining": game.deck.cards_remaining(),
+        "chosen": game.cards_chosen_this_room,
+        "used_potion": player.used_potion_this_turn,
+        "avoided": game.avoided_previous_room,
+        "over": game.is_over(),
+        "score": game.calculate_score(),
+    }
+
+
+def batch_view(batch, row):
+    """The same, read from row of a BatchGame"""
+    return {
+        "health": int(batch.health[row]),
+        "weapon": int(batch.weapon[row]),
+        "last_slain": int(batch.last_slain[row]),
+        "room": [int(card) for card in batch.room[row, :batch.room_count[row]]],
+        "cards_remaining": int(batch.deck_end[row] - batch.head[row]),
+        "chosen": int(batch.chosen[row]),
+        "used_potion": bool(batch.used_potion[row]),
+        "avoided": bool(batch.avoided[row]),
+        "over": bool(batch.over[row]),
+        "score": int(batch.scores([row])[0]),
+    }
+
+
+@pytest.mark.parametrize("policy", [first_card_policy, random_policy, greedy_policy])
+def test_batch_plays_like_game(policy):
+    batch = BatchGame(np.array(SEEDS, dtype=np.uint64))
+    games = [Game(seed) for seed in SEEDS]
+    while not batch.over.all():
+        actions = policy(batch)
+        live = ~batch.over
+        batch.step(actions)
+        for row in np.flatnonzero(live):
+            games[row].apply(int(actions[row]))
+            assert batch_view(batch, row) == game_view(games[row])
+
+    scores = batch.scores()
+    for row, seed in enumerate(SEEDS):
+        actions = batch.actions[row, :batch.action_count[row]].tolist()
+        game = Game.replay(seed, actions)
+        assert game.is_over()
+        assert game_view(game) == batch_view(batch, row)
+        assert game.calculate_score() == scores[row]
+        assert game.room_number == batch.room_number[row]
+
+
+def test_batch_plays_like_game_to_the_end():
+    """As above, with health kept full in both so that the games clear the
+    dungeon, avoiding rooms near the end of the deck too"""
+    batch = BatchGame(np.array(SEEDS, dtype=np.uint64))
+    games = [Game(seed) for seed in SEEDS]
+    while not batch.over.all():
+        live = np.flatnonzero(~batch.over)
+        batch.health[live] = batch.max_health
+        for row in live:
+            games[row].player.health = games[row].player.max_health
+        actions = random_policy(batch)
+        batch.step(actions)
+        for row in live:
+            games[row].apply(int(actions[row]))
+            assert batch_view(batch, row) == game_view(games[row])
+    assert (batch.health > 0).all()
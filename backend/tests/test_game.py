@@ -0,0 +1,59 @@
+import random
+import pytest
+from game_logic.game import STATE_SIZE, Game
+
+
+def state_of(game):
+    """get_state() without the version, which to_bytes does not keep and
+    undo bumps"""
+    return dict(game.get_state(), version=None)
+
+
+def top_up(game, rng):
+    """Set health high enough that no card can kill (an ace does 14), so that
+    games reach the end of the deck"""
+    game.player.health = rng.randint(15, game.player.max_health)
+    game.hash = game.compute_hash()
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_packed_state_round_trip(seed):
+    rng = random.Random(seed)
+    game = Game(seed)
+    while True:
+        if seed % 2 == 0 and not game.is_over():
+            top_up(game, rng)
+        data = game.to_bytes()
+        assert len(data) == STATE_SIZE
+        unpacked = Game.from_bytes(data, game.id)
+        assert state_of(unpacked) == state_of(game)
+        assert unpacked.to_bytes() == data
+        if game.is_over():
+            break
+        # The unpacked game also plays on exactly like the original
+        action = rng.choice(game.legal_actions())
+        game.apply(action)
+        unpacked.apply(action)
+        assert state_of(unpacked) == state_of(game)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_apply_keeps_hash_and_undo_restores(seed):
+    rng = random.Random(seed)
+    game = Game(seed)
+    history = []
+    while not game.is_over():
+        if seed % 2 == 0:
+            top_up(game, rng)
+        before = (state_of(game), game.hash, game.to_bytes(), bytes(game.actions))
+        token = game.apply(rng.choice(game.legal_actions()))
+        assert game.hash == game.compute_hash()
+        history.append((token, before))
+        # Undo straight away now and then, and play on from there
+        if rng.random() < 0.2:
+            game.undo(token)
+            assert (state_of(game), game.hash, game.to_bytes(), bytes(game.actions)) == before
+            history.pop()
+    for token, before in reversed(history):
+        game.undo(token)
+        assert (state_of(game), game.hash, game.to_bytes(), bytes(game.actions)) == before
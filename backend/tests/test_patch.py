@@ -0,0 +1,44 @@
+import random
+from game_logic.game import AVOID_ROOM, CHANGE_HISTORY, Game
+
+
+def apply_patch(state, patch):
+    """What applyPatch in frontend/services/api.js makes of a patch"""
+    result = dict(state, **patch["set"], version=patch["version"])
+    if "room" in patch:
+        remove = patch["room"]["remove"]
+        result["current_room"] = [card for slot, card in enumerate(state["current_room"])
+                                  if slot not in remove] + patch["room"]["append"]
+    if "slain_monsters" in patch:
+        slain = patch["slain_monsters"]
+        result["slain_monsters"] = state["slain_monsters"][:slain["keep"]] + slain["append"]
+    return result
+
+
+def check_patches(seed):
+    """Play a game at random, checking every patch get_patch can make on the
+    way. Returns how often a room was avoided near the end of the deck."""
+    rng = random.Random(seed)
+    game = Game(seed)
+    states = {}
+    short_deck_avoids = 0
+    while not game.is_over():
+        # Keep the player alive so games reach the end of the deck
+        game.player.health = rng.randint(game.player.max_health // 2, game.player.max_health)
+        states[game.version] = game.get_state()
+        action = rng.choice(game.legal_actions())
+        if action == AVOID_ROOM and game.deck.cards_remaining() < 4:
+            short_deck_avoids += 1
+        game.apply(action)
+        state = game.get_state()
+        for version in range(max(0, game.version - CHANGE_HISTORY), game.version + 1):
+            if version in states:
+                assert apply_patch(states[version], game.get_patch(version)) == state
+        assert game.get_patch(game.version - CHANGE_HISTORY - 1) is None
+    return short_deck_avoids
+
+
+def test_patches_rebuild_state():
+    short_deck_avoids = sum(check_patches(seed) for seed in range(100))
+    # Those draw the last deck cards ahead of the avoided ones
+    assert short_deck_avoids > 0
@@ -0,0 +1,67 @@
+import random
+import pytest
+from game_logic.game import Game
+from game_logic.solver import _Solver, _state_of, solve, solve_value
+
+
+def best_score(game):
+    """The highest final score over every line of play"""
+    if game.is_over():
+        return game.calculate_score()
+    best = None
+    for action in game.legal_actions():
+        token = game.apply(action)
+        score = best_score(game)
+        game.undo(token)
+        if best is None or score > best:
+            best = score
+    return best
+
+
+def endgame(seed, cards_left):
+    """A game played at random until cards_left cards are left in the deck.
+    Health is topped up on the way so it survives, then set at random."""
+    rng = random.Random(seed)
+    game = Game(seed)
+    while game.deck.cards_remaining() > cards_left:
+        game.player.health = game.player.max_health
+        game.apply(rng.choice(game.legal_actions()))
+    game.player.health = rng.randint(1, game.player.max_health)
+    return game
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_solve_matches_brute_force(seed):
+    game = endgame(seed, seed % 5)
+    score, actions = solve(game)
+    assert score == best_score(game)
+    for action in actions:
+        game.apply(action)
+    assert game.is_over()
+    assert game.calculate_score() == score
+
+
+def test_solve_leaves_game_unchanged():
+    game = endgame(0, 3)
+    state = game.get_state()
+    solve(game)
+    # Only the version moves on, as undo() counts as a change
+    assert dict(game.get_state(), version=None) == dict(state, version=None)
+
+
+def test_solve_value_matches_solve():
+    game = endgame(1, 4)
+    assert solve_value(game)[0] == solve(game)[0]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_upper_bound_never_below_best_score(seed):
+    # The search prunes on the bound, so one that is too low loses lines.
+    # Full health lets potions count for more than healing.
+    rng = random.Random(seed)
+    game = endgame(seed, seed % 5)
+    if seed % 2 == 0:
+        game.player.health = game.player.max_health
+    while not game.is_over():
+        assert _Solver(game).upper_bound(_state_of(game)) >= best_score(game)
+        game.apply(rng.choice(game.legal_actions()))
@@ -56,7 +56,7 @@ const GameBoard = ({
         <Button 
           mode="contained" 
           onPress={onAvoidRoom}
-          disabled={loading || isGameOver || gameState.avoided_previous_room || gameState.current_room.length < 4}
+          disabled={loading || isGameOver || gameState.avoided_previous_room || gameState.cards_chosen_this_room > 0}
           style={styles.button}
         >
           Avoid Room
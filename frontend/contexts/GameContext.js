@@ -1,5 +1,5 @@
-import React, { createContext, useState, useContext, useEffect } from 'react';
-import { createGame, performAction } from '../services/api';
+import React, { createContext, useState, useContext, useEffect, useRef } from 'react';
+import { AVOID_ROOM, createGame, fetchState, openGameSocket, performAction } from '../services/api';
 import AsyncStorage from '@react-native-async-storage/async-storage';
 
 const GameContext = createContext();
@@ -11,6 +11,7 @@ export const GameProvider = ({ children }) => {
   const [gameId, setGameId] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const socket = useRef(null);
 
   // Load saved game state
   useEffect(() => {
@@ -19,11 +20,24 @@ export const GameProvider = ({ children }) => {
         const savedState = await AsyncStorage.getItem('gameState');
         const savedId = await AsyncStorage.getItem('gameId');
         if (savedState && savedId) {
-          setGameState(JSON.parse(savedState));
+          const saved = JSON.parse(savedState);
+          setGameState(saved);
           setGameId(savedId);
+          // The saved copy may be stale; the server answers 304 if it is not
+          const latest = await fetchState(savedId, saved.version);
+          if (latest) {
+            setGameState(latest.state);
+          }
         }
       } catch (err) {
-        console.error('Failed to load saved game:', err);
+        if (err.response && err.response.status === 404) {
+          // The server no longer has the game
+          await AsyncStorage.multiRemove(['gameState', 'gameId']);
+          setGameState(null);
+          setGameId(null);
+        } else {
+          console.error('Failed to load saved game:', err);
+        }
       }
     };
     loadSavedState();
@@ -44,6 +58,18 @@ export const GameProvider = ({ children }) => {
     saveState();
   }, [gameState, gameId]);
 
+  // Play the current game over a WebSocket session while one is open
+  useEffect(() => {
+    if (!gameId) {
+      return undefined;
+    }
+    socket.current = openGameSocket(gameId, setGameState);
+    return () => {
+      socket.current.close();
+      socket.current = null;
+    };
+  }, [gameId]);
+
   const startNewGame = async () => {
     try {
       setLoading(true);
@@ -60,10 +86,13 @@ export const GameProvider = ({ children }) => {
   };
 
   const selectCard = async (cardIndex) => {
+    if (socket.current && socket.current.sendAction(cardIndex)) {
+      return;
+    }
     try {
       setLoading(true);
       setError(null);
-      const response = await performAction(gameId, 'select_card', cardIndex);
+      const response = await performAction(gameId, 'select_card', cardIndex, gameState);
       setGameState(response.state);
     } catch (err) {
       setError('Failed to select card. Please try again.');
@@ -74,10 +103,13 @@ export const GameProvider = ({ children }) => {
   };
 
   const avoidRoom = async () => {
+    if (socket.current && socket.current.sendAction(AVOID_ROOM)) {
+      return;
+    }
     try {
       setLoading(true);
       setError(null);
-      const response = await performAction(gameId, 'avoid_room');
+      const response = await performAction(gameId, 'avoid_room', null, gameState);
       setGameState(response.state);
     } catch (err) {
       setError('Failed to avoid room. Please try again.');
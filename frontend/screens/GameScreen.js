@@ -51,7 +51,7 @@ const GameScreen = ({ navigation }) => {
         <Button 
           mode="contained" 
           onPress={avoidRoom}
-          disabled={loading || gameState.avoided_previous_room}
+          disabled={loading || gameState.avoided_previous_room || gameState.cards_chosen_this_room > 0}
           style={styles.button}
         >
           Avoid Room
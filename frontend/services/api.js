@@ -23,7 +23,42 @@ export const createGame = async () => {
   }
 };
 
-export const performAction = async (gameId, actionType, cardIndex = null) => {
+// Fetch a game's state. Given the version we already have, resolves to
+// null when that is still current (the server answers 304 Not Modified).
+export const fetchState = async (gameId, version = null) => {
+  try {
+    const headers = {};
+    if (version !== null && version !== undefined) {
+      headers['If-None-Match'] = `"${version}"`;
+    }
+    const response = await apiClient.get(`/state/${gameId}`, {
+      headers,
+      validateStatus: (status) => status === 200 || status === 304,
+    });
+    return response.status === 304 ? null : response.data;
+  } catch (error) {
+    console.error('API Error - Fetch State:', error);
+    throw error;
+  }
+};
+
+// Apply a patch from the server (see Game.get_patch) to the state it was made against
+export const applyPatch = (state, patch) => {
+  const next = { ...state, ...patch.set, version: patch.version };
+  if (patch.room) {
+    next.current_room = state.current_room
+      .filter((card, slot) => !patch.room.remove.includes(slot))
+      .concat(patch.room.append);
+  }
+  if (patch.slain_monsters) {
+    next.slain_monsters = state.slain_monsters
+      .slice(0, patch.slain_monsters.keep)
+      .concat(patch.slain_monsters.append);
+  }
+  return next;
+};
+
+export const performAction = async (gameId, actionType, cardIndex = null, currentState = null) => {
   try {
     const payload = {
       game_id: gameId,
@@ -35,10 +70,77 @@ export const performAction = async (gameId, actionType, cardIndex = null) => {
       payload.card_index = cardIndex;
     }
     
+    // Given the state we have, the server only sends what changed
+    if (currentState && currentState.version !== undefined) {
+      payload.since_version = currentState.version;
+    }
+    
     const response = await apiClient.post('/action', payload);
+    if (response.data.patch) {
+      return { state: applyPatch(currentState, response.data.patch) };
+    }
     return response.data;
   } catch (error) {
     console.error(`API Error - ${actionType}:`, error);
     throw error;
   }
-};
\ No newline at end of file
+};
+
+// Actions sent over the game socket: 0-3 pick that room card
+export const AVOID_ROOM = 4;
+
+// A WebSocket session for a game (see /ws/{game_id} in backend/app.py).
+// onState gets every state the server pushes. The socket reconnects after
+// drops and resumes from the last version it got; sendAction returns false
+// while it is not connected, so callers can fall back to performAction.
+export const openGameSocket = (gameId, onState) => {
+  let state = null;
+  let socket = null;
+  let closed = false;
+  let retryDelay = 500;
+
+  const connect = () => {
+    const query = state ? `?since_version=${state.version}` : '';
+    socket = new WebSocket(`${API_URL.replace(/^http/, 'ws')}/ws/${gameId}${query}`);
+    socket.onopen = () => {
+      retryDelay = 500;
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'ping') {
+        socket.send(JSON.stringify({ type: 'pong' }));
+      } else if (message.type === 'state') {
+        state = message.state;
+        onState(state);
+      } else if (message.type === 'patch') {
+        state = applyPatch(state, message.patch);
+        onState(state);
+      } else if (message.type === 'error') {
+        console.error('Game socket error:', message.detail);
+      }
+    };
+    socket.onclose = (event) => {
+      // 4404: the server no longer has the game
+      if (closed || event.code === 4404) {
+        return;
+      }
+      setTimeout(connect, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, 10000);
+    };
+  };
+  connect();
+
+  return {
+    sendAction: (action) => {
+      if (!state || socket.readyState !== WebSocket.OPEN) {
+        return false;
+      }
+      socket.send(JSON.stringify({ type: 'action', action }));
+      return true;
+    },
+    close: () => {
+      closed = true;
+      socket.close();
+    },
+  };
+};
@@ -1,5 +1,14 @@
 # gameplay.py
-from objects import CardType, Deck, Player, Room, DiscardPile
+import struct
+from objects import CARDS, CardType, Deck, Player, Room, DiscardPile, pack_cards, unpack_cards
+
+# Packed state layout (see GameEngine.to_bytes): a 10 byte header followed by
+# the deck, room, monster stack, discard pile and this turn's potions as
+# 6-bit card ids.
+STATE_SIZE = 64
+STATE_VERSION = 1
+_STATE_HEADER = struct.Struct(">BbBBBBBBBB")
+_NO_CARD = 0xFF
 
 class GameEngine:
     def __init__(self):
@@ -93,12 +102,12 @@ class GameEngine:
             # Check if we can use the equipped weapon
             weapon_usable = False
             if self.player.equipped_weapon:
-                if not self.player.monster_stack or card.get_damage() <= self.player.get_last_monster_value():
+                if not self.player.monster_stack or card.damage <= self.player.get_last_monster_value():
                     weapon_usable = True
                     
             if weapon_usable:
                 # Fight with weapon
-                monster_damage = card.get_damage()
+                monster_damage = card.damage
                 weapon_damage = self.player.get_weapon_value()
                 damage_taken = 0 if self.god_mode else max(0, monster_damage - weapon_damage)  # No damage in god mode
                 
@@ -121,7 +130,7 @@ class GameEngine:
                 return True, result
             else:
                 # Fight barehanded
-                monster_damage = card.get_damage()
+                monster_damage = card.damage
                 damage_taken = 0 if self.god_mode else monster_damage  # No damage in god mode
                 
                 if not self.god_mode:  # Only take damage if not in god mode
@@ -171,12 +180,12 @@ class GameEngine:
         remaining_monster_value = 0
         for card in self.deck.cards:
             if card.type == CardType.MONSTER:
-                remaining_monster_value += card.get_damage()
+                remaining_monster_value += card.damage
                 
         # Add remaining monsters in the room
         for card in self.room.get_cards():
             if card.type == CardType.MONSTER:
-                remaining_monster_value += card.get_damage()
+                remaining_monster_value += card.damage
                 
         # Calculate negative score
         return -(abs(self.player.health) + remaining_monster_value)
@@ -186,7 +195,7 @@ class GameEngine:
         # Check if the last card was a health potion
         if self.discard.cards and self.discard.cards[-1].type == CardType.POTION and self.player.health == 20:
             # Perfect score + potion value
-            return 20 + self.discard.cards[-1].get_damage()
+            return 20 + self.discard.cards[-1].damage
         else:
             # Just the remaining health
             return self.player.health
@@ -205,7 +214,7 @@ class GameEngine:
         if self.player.equipped_weapon:
             weapon_info = f"Equipped weapon: {self.player.equipped_weapon}"
             if self.player.monster_stack:
-                monster_values = [str(m.get_damage()) for m in self.player.monster_stack]
+                monster_values = [str(m.damage) for m in self.player.monster_stack]
                 weapon_info += f" (slain monsters: {', '.join(monster_values)})"
             info.append(weapon_info)
         else:
@@ -218,4 +227,43 @@ class GameEngine:
         return [
             f"Cards remaining in dungeon: {self.deck.cards_remaining()}",
             f"Cards in discard pile: {len(self.discard.cards)}"
-        ]
\ No newline at end of file
+        ]
+        
+    def to_bytes(self):
+        """Pack the game state into STATE_SIZE bytes"""
+        player = self.player
+        weapon = player.equipped_weapon
+        flags = self.last_avoided | (self.game_over << 1) | (self.god_mode << 2)
+        header = _STATE_HEADER.pack(
+            STATE_VERSION, player.health, player.max_health, flags,
+            weapon.id if weapon else _NO_CARD,
+            len(self.deck.cards), self.room.size(), len(player.monster_stack),
+            len(self.discard.cards), len(self.current_turn_potions),
+        )
+        cards = (self.deck.cards + self.room.cards + player.monster_stack +
+                 self.discard.cards + self.current_turn_potions)
+        return header + pack_cards(cards, STATE_SIZE - _STATE_HEADER.size)
+        
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild an engine packed by to_bytes"""
+        if len(data) != STATE_SIZE or data[0] != STATE_VERSION:
+            raise ValueError("Not a packed game state")
+        (_, health, max_health, flags, weapon, n_deck, n_room, n_stack,
+         n_discard, n_potions) = _STATE_HEADER.unpack_from(data)
+        cards = unpack_cards(data[_STATE_HEADER.size:],
+                             n_deck + n_room + n_stack + n_discard + n_potions)
+        
+        engine = cls()
+        engine.deck.cards = cards[:n_deck]
+        engine.room.cards = cards[n_deck:n_deck + n_room]
+        engine.player.health = health
+        engine.player.max_health = max_health
+        engine.player.equipped_weapon = CARDS[weapon] if weapon != _NO_CARD else None
+        engine.player.monster_stack = cards[n_deck + n_room:n_deck + n_room + n_stack]
+        engine.discard.cards = cards[n_deck + n_room + n_stack:len(cards) - n_potions]
+        engine.current_turn_potions = cards[len(cards) - n_potions:]
+        engine.last_avoided = bool(flags & 1)
+        engine.game_over = bool(flags & 2)
+        engine.god_mode = bool(flags & 4)
+        return engine
@@ -14,36 +14,47 @@ class Suit(Enum):
     HEARTS = auto()
 
 class Card:
-    def __init__(self, value, suit):
-        self.value = value
-        self.suit = suit
-        
-        # Determine card type based on suit
-        if suit in [Suit.CLUBS, Suit.SPADES]:
-            self.type = CardType.MONSTER
-        elif suit == Suit.DIAMONDS:
-            self.type = CardType.WEAPON
-        elif suit == Suit.HEARTS:
-            self.type = CardType.POTION
-            
+    """A Scoundrel card.
+
+    There is exactly one instance of each legal card (see ``CARDS``);
+    ``Card(value, suit)`` returns that shared instance.
+    """
+
+    __slots__ = ("value", "suit", "type", "id", "damage")
+
+    def __new__(cls, value, suit):
+        try:
+            return _CARDS_BY_KEY[value, suit]
+        except KeyError:
+            raise ValueError(f"{value} of {suit.name} is not a Scoundrel card") from None
+
+    @classmethod
+    def _create(cls, card_id, value, suit):
+        card = object.__new__(cls)
+        setattr_ = object.__setattr__
+        setattr_(card, "id", card_id)
+        setattr_(card, "value", value)
+        setattr_(card, "suit", suit)
+        setattr_(card, "type", SUIT_TYPES[suit])
+        # Aces are worth 14
+        setattr_(card, "damage", 14 if value == 1 else value)
+        return card
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Card is immutable")
+
+    def __reduce__(self):
+        return Card, (self.value, self.suit)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
     def get_damage(self):
         """Return the damage value of the card."""
-        if self.type == CardType.MONSTER:
-            # Face cards and Ace have special values
-            if self.value == 1:  # Ace
-                return 14
-            elif self.value == 11:  # Jack
-                return 11
-            elif self.value == 12:  # Queen
-                return 12
-            elif self.value == 13:  # King
-                return 13
-            else:
-                return self.value
-        elif self.type == CardType.WEAPON:
-            return self.value
-        else:  # Potion
-            return self.value
+        return self.damage
             
     def __str__(self):
         value_map = {1: "Ace", 11: "Jack", 12: "Queen", 13: "King"}
@@ -53,6 +64,50 @@ class Card:
     def __repr__(self):
         return self.__str__()
 
+
+SUIT_TYPES = {
+    Suit.CLUBS: CardType.MONSTER,
+    Suit.SPADES: CardType.MONSTER,
+    Suit.DIAMONDS: CardType.WEAPON,
+    Suit.HEARTS: CardType.POTION,
+}
+
+
+def _build_cards():
+    """Build the Scoundrel deck (standard deck without Red Face Cards and Red Aces)"""
+    cards = []
+    for suit in Suit:
+        for damage in range(2, 15):  # 2-10, Jack, Queen, King, Ace
+            # Red suits only go from 2 to 9
+            if suit in (Suit.DIAMONDS, Suit.HEARTS) and damage > 9:
+                continue
+            value = 1 if damage == 14 else damage
+            cards.append(Card._create(len(cards), value, suit))
+    return tuple(cards)
+
+
+# The 42 legal cards, indexed by ``Card.id``
+CARDS = _build_cards()
+_CARDS_BY_KEY = {(card.value, card.suit): card for card in CARDS}
+
+
+def pack_cards(cards, size):
+    """Pack cards as 6-bit ids into ``size`` bytes, first card in the high bits"""
+    bits = 0
+    for card in cards:
+        bits = (bits << 6) | card.id
+    return (bits << (size * 8 - 6 * len(cards))).to_bytes(size, "big")
+
+
+def unpack_cards(data, count):
+    """Inverse of ``pack_cards``: read ``count`` cards back from ``data``"""
+    bits = int.from_bytes(data, "big") >> (len(data) * 8 - 6 * count)
+    cards = [None] * count
+    for i in range(count - 1, -1, -1):
+        cards[i] = CARDS[bits & 0x3F]
+        bits >>= 6
+    return cards
+
 class Deck:
     def __init__(self):
         self.cards = []
@@ -60,26 +115,7 @@ class Deck:
         
     def build(self):
         """Build the Scoundrel deck (standard deck without Red Face Cards and Red Aces)"""
-        self.cards = []
-        
-        # Add Clubs and Spades (monsters) - all values
-        for suit in [Suit.CLUBS, Suit.SPADES]:
-            for value in range(1, 14):  # 1-13 (Ace to King)
-                self.cards.append(Card(value, suit))
-                
-        # Add Diamonds (weapons) - all values
-        for value in range(1, 10):  # 1-9 (Ace to 9)
-            self.cards.append(Card(value, Suit.DIAMONDS))
-                
-        # Add Hearts (potions) - all values
-        for value in range(1, 10):  # 1-9 (Ace to 9)
-            self.cards.append(Card(value, Suit.HEARTS))
-            
-        # Remove Red Face Cards and Red Aces as per rules
-        self.cards = [card for card in self.cards if not (
-            (card.suit == Suit.DIAMONDS or card.suit == Suit.HEARTS) and 
-            (card.value == 1 or card.value >= 11)
-        )]
+        self.cards = list(CARDS)
             
     def shuffle(self):
         """Shuffle the deck"""
@@ -122,18 +158,18 @@ class Player:
     def get_weapon_value(self):
         """Get the current weapon's damage value"""
         if self.equipped_weapon:
-            return self.equipped_weapon.get_damage()
+            return self.equipped_weapon.damage
         return 0
         
     def get_last_monster_value(self):
         """Get the value of the last monster slain with the current weapon"""
         if self.monster_stack:
-            return self.monster_stack[-1].get_damage()
+            return self.monster_stack[-1].damage
         return 0
         
     def drink_potion(self, potion):
         """Drink a health potion"""
-        potion_value = potion.get_damage()
+        potion_value = potion.damage
         self.health = min(self.health + potion_value, self.max_health)
         return potion_value
         